@@ -0,0 +1,51 @@
+import asyncio
+from typing import Awaitable, Callable
+from telethon import types
+from logger_setup import get_logger
+
+logger = get_logger("album")
+
+
+class AlbumAggregator:
+    """
+    Собирает сообщения одного альбома (общий grouped_id), которые Telegram
+    присылает отдельными событиями, и отдаёт их одной пачкой,
+    когда за window секунд не пришло ни одного нового элемента.
+    """
+
+    def __init__(self, window: float, on_album: Callable[[list[types.Message]], Awaitable[None]]):
+        self.window = window
+        self.on_album = on_album
+        self._groups: dict[int, list[types.Message]] = {}
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def add(self, message: types.Message):
+        grouped_id = message.grouped_id
+        self._groups.setdefault(grouped_id, []).append(message)
+        timer = self._timers.pop(grouped_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[grouped_id] = asyncio.get_running_loop().call_later(self.window, self._flush, grouped_id)
+
+    def _flush(self, grouped_id: int):
+        self._timers.pop(grouped_id, None)
+        messages = sorted(self._groups.pop(grouped_id, []), key=lambda m: m.id)
+        if not messages:
+            return
+        task = asyncio.create_task(self._deliver(messages))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, messages: list[types.Message]):
+        try:
+            await self.on_album(messages)
+        except Exception as e:
+            logger.exception("Error handling album %s: %s", messages[0].grouped_id, e)
+
+    async def flush_all(self):
+        """Отдаёт все недособранные альбомы сразу (при остановке)."""
+        for grouped_id in list(self._timers):
+            self._timers[grouped_id].cancel()
+            self._flush(grouped_id)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -1,61 +1,62 @@
+import argparse
 import asyncio
 import os
 from config import settings
-from logger_setup import logger
-from db import init_db, already_uploaded, record_upload
+from logger_setup import get_logger
+from db import init_db, close_db
 from telegram_client import TGClient
-from youtube_client import YouTubeUploader
+from youtube_client import YouTubeUploaderPool
+from metrics import registry
 
-app_state = {}
+logger = get_logger("app")
 
 
-async def handle_new_video(message, file_path: str, post_text: str, media_type: str):
-    """
-    Обработчик нового сообщения: загружает видео на YouTube,
-    добавляет запись в базу и удаляет локальный файл после успешного аплоада.
-    """
-    chat_id = getattr(message.peer_id, 'channel_id', str(settings.TG_CHANNELS[0]))
+async def main():
+    if settings.ROLE not in ("all", "listener", "worker"):
+        raise ValueError(f"Unknown ROLE: {settings.ROLE}")
+    os.makedirs(os.path.dirname(settings.DB_PATH), exist_ok=True)
+    os.makedirs(settings.DOWNLOAD_DIR, exist_ok=True)
+    await init_db()
+    logger.info(f"Database initialized, role {settings.ROLE}, worker {settings.WORKER_ID}")
+    registry.serve(settings.METRICS_HOST, settings.METRICS_PORT)
 
-    title_candidate = (post_text.splitlines()[0] if post_text else f"Telegram post {message.id}")[:settings.MAX_TITLE_LENGTH]
-    description = post_text
+    # Один общий пул загрузчиков YouTube на всё приложение
+    yt = YouTubeUploaderPool()
+    tg = TGClient(yt)
 
     try:
-        yt_id = await app_state["yt"].upload_async(file_path, title_candidate, description, settings.YOUTUBE_UPLOAD_PRIVACY)
-        logger.info(f"Uploaded to YouTube: {yt_id}")
-
-        # Записываем в DB только после успешного upload
-        record_upload(str(message.id), str(chat_id), post_text, file_path, yt_video_id=yt_id)
-
-        # Удаляем локальный файл после успешного аплоада
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logger.info(f"Deleted local file {file_path}")
+        await tg.run_forever()
+    finally:
+        await close_db()
 
-    except Exception as e:
-        logger.exception("Failed to upload video for message %s: %s", message.id, e)
-        return
 
-    if already_uploaded(message.id, chat_id):
-        logger.info(f"Message {message.id} successfully uploaded and recorded in DB.")
+async def backfill_main():
+    """Однократный проход по истории каналов: ставит пропущенные видео в конвейер и ждёт их."""
+    from backfill import backfill
 
-
-async def main():
     os.makedirs(os.path.dirname(settings.DB_PATH), exist_ok=True)
     os.makedirs(settings.DOWNLOAD_DIR, exist_ok=True)
-    init_db()
-    logger.info("Database initialized")
+    await init_db()
+    registry.serve(settings.METRICS_HOST, settings.METRICS_PORT)
 
     tg = TGClient()
-    yt = YouTubeUploader()
-    app_state["tg"] = tg
-    app_state["yt"] = yt
-
-    # tg.add_new_message_handler(handle_new_video)
+    await tg.start()
+    await tg.pipeline.start()
+    try:
+        submitted = await backfill(tg)
+        logger.info(f"Backfill submitted {submitted} jobs, waiting for pipeline")
+        await tg.pipeline.drain()
+    finally:
+        await tg.pipeline.stop()
+        await tg.client.disconnect()
+        await close_db()
 
-    await tg.run_forever()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backfill", action="store_true", help="обработать историю каналов и выйти")
+    args = parser.parse_args()
     try:
-        asyncio.run(main())
+        asyncio.run(backfill_main() if args.backfill else main())
     except (KeyboardInterrupt, SystemExit):
         logger.info("Shutting down.")
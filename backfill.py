@@ -0,0 +1,98 @@
+import asyncio
+import os
+import time
+from config import settings
+from logger_setup import get_logger
+from db import already_uploaded_many, get_channel_state, save_channel_state
+from telegram_client import TGClient, video_filename
+
+logger = get_logger("backfill")
+
+
+class RateLimiter:
+    """Не чаще rate событий в секунду (rate <= 0 — без ограничения)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            await asyncio.sleep(self._next - now)
+        self._next = max(now, self._next) + self.interval
+
+
+async def backfill_channel(tg: TGClient, entity, limiter: RateLimiter) -> int:
+    """
+    Проходит историю канала от сохранённой отметки к новым сообщениям.
+    Отметка сохраняется после каждой страницы, поэтому прерванный проход
+    продолжается с того же места. Возвращает число поставленных задач.
+    """
+    chat_id = entity.id
+    state = await get_channel_state(chat_id)
+    high_water = state.backfill_max_id if state else 0
+    title = getattr(entity, "title", chat_id)
+    logger.info(f"Backfill {title}: starting after message {high_water}")
+
+    submitted = 0
+    page = []
+
+    async def flush(final: bool = False):
+        nonlocal submitted
+        cut = len(page)
+        if not final:
+            # Альбом на границе страницы уходит со следующей: его элементы попадают в конвейер вместе
+            while cut and page[cut - 1].grouped_id and page[cut - 1].grouped_id == page[-1].grouped_id:
+                cut -= 1
+            if cut == 0:
+                return
+        batch = page[:cut]
+        del page[:cut]
+        done = await already_uploaded_many(chat_id, [m.id for m in batch])
+        # Как в живом обработчике: элементы альбома — одной группой, остальные сообщения по одному
+        units: dict[tuple[str, int], list] = {}
+        for message in batch:
+            if message.id not in done:
+                key = ("album", message.grouped_id) if message.grouped_id else ("message", message.id)
+                units.setdefault(key, []).append(message)
+        for (kind, _), messages in units.items():
+            if kind == "album":
+                for _ in messages:
+                    await limiter.wait()
+                submitted += await tg.on_album(messages)
+                continue
+            message = messages[0]
+            filename = video_filename(message)
+            if filename is None:
+                continue
+            await limiter.wait()
+            post_text = message.message or message.text or ""
+            out_path = os.path.join(settings.DOWNLOAD_DIR, filename)
+            if await tg.pipeline.submit(message, chat_id, post_text, out_path):
+                submitted += 1
+        # Задачи уже в таблице jobs — отметку можно двигать
+        await save_channel_state(chat_id, backfill_max_id=batch[-1].id)
+
+    async for message in tg.client.iter_messages(entity, reverse=True, min_id=high_water):
+        page.append(message)
+        if len(page) >= settings.BACKFILL_PAGE_SIZE:
+            await flush()
+    if page:
+        await flush(final=True)
+
+    logger.info(f"Backfill {title}: {submitted} jobs submitted")
+    return submitted
+
+
+async def backfill(tg: TGClient) -> int:
+    limiter = RateLimiter(settings.BACKFILL_RATE)
+    total = 0
+    for entity in tg.channel_entities:
+        try:
+            total += await backfill_channel(tg, entity, limiter)
+        except Exception as e:
+            logger.exception("Backfill failed for %s: %s", getattr(entity, "title", entity.id), e)
+    return total
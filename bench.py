@@ -0,0 +1,488 @@
+"""
+Офлайн-бенчмарк конвейера без Telegram и YouTube.
+
+Telethon заменяется локальной подделкой (iter_download, download_media и
+соединения параллельного скачивания) с заданной скоростью и задержкой,
+resumable-эндпоинт YouTube — локальным HTTP-сервером, который умеет отдавать
+5xx, рвать соединение и отвечать quotaExceeded. Через конвейер прогоняется
+пачка из N видео размера S, в конце — пропускная способность, p50/p99
+задержки от поста до id на YouTube, пиковый RSS и пиковое место на диске.
+
+    python bench.py --videos 20 --size 50M --tg-bandwidth 20M --error-rate 0.05
+
+Остальные настройки конвейера берутся из окружения как обычно
+(DOWNLOAD_CONCURRENCY, STREAM_UPLOAD, MEDIA_STAGE и т.д.).
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+BENCH_CHAT_ID = 1000000001
+BLOCK = 4096
+
+
+def parse_size(value: str) -> int:
+    """'50M', '1.5G', '512K' или просто байты."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMG]?)i?B?\s*", value, re.I)
+    if not match:
+        raise argparse.ArgumentTypeError(f"bad size: {value}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " KMG".index(unit.upper() or " "))
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def synthetic_bytes(document_id: int, offset: int, length: int) -> bytes:
+    """Детерминированное содержимое: у каждого документа свои байты (иначе сработает дедупликация по sha256)."""
+    block = hashlib.sha256(str(document_id).encode()).digest() * (BLOCK // 32)
+    start = offset % BLOCK
+    return (block * ((start + length) // BLOCK + 1))[start:start + length]
+
+
+# --- подделка Telegram ---
+
+class FakeTelegram:
+    """Вместо TelegramClient: синтетические файлы с ограничением скорости и задержкой на запрос."""
+
+    REQUEST_SIZE = 512 * 1024
+
+    def __init__(self, bandwidth: int, latency: float):
+        self.bandwidth = bandwidth  # байт/с на одно соединение, 0 — без ограничения
+        self.latency = latency
+        self.session = SimpleNamespace(dc_id=1, auth_key=None)
+        self.sizes: dict[int, int] = {}
+
+    async def _transfer(self, length: int):
+        await asyncio.sleep(self.latency + (length / self.bandwidth if self.bandwidth else 0))
+
+    async def iter_download(self, file, request_size: int = REQUEST_SIZE):
+        document = getattr(file, "document", file)
+        for offset in range(0, document.size, request_size):
+            length = min(request_size, document.size - offset)
+            await self._transfer(length)
+            yield synthetic_bytes(document.id, offset, length)
+
+    async def download_media(self, media, file: str, progress_callback=None):
+        done = 0
+        with open(file, "wb") as f:
+            async for chunk in self.iter_download(media):
+                f.write(chunk)
+                done += len(chunk)
+                if progress_callback:
+                    progress_callback(done, media.document.size)
+        return file
+
+    async def get_messages(self, *args, **kwargs):
+        return None
+
+    async def create_sender(self, dc_id: int):
+        """Замена ParallelDownloader._create_sender: у каждого соединения своя полоса."""
+        return _FakeSender(self)
+
+
+class _FakeSender:
+    def __init__(self, telegram: FakeTelegram):
+        self.telegram = telegram
+
+    async def send(self, request):
+        size = self.telegram.sizes[request.location.id]
+        length = max(0, min(request.limit, size - request.offset))
+        await self.telegram._transfer(length)
+        return SimpleNamespace(bytes=synthetic_bytes(request.location.id, request.offset, length))
+
+    async def disconnect(self):
+        pass
+
+
+def make_message(telegram: FakeTelegram, message_id: int, size: int):
+    from telethon import types
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    document_id = uuid.uuid4().int >> 66
+    telegram.sizes[document_id] = size
+    document = types.Document(
+        id=document_id, access_hash=0, file_reference=b"", date=now, mime_type="video/mp4",
+        size=size, dc_id=1, thumbs=None,
+        attributes=[types.DocumentAttributeVideo(duration=60, w=1280, h=720)],
+    )
+    return types.Message(
+        id=message_id, peer_id=types.PeerChannel(BENCH_CHAT_ID), date=now,
+        message=f"Bench video {message_id}", media=types.MessageMediaDocument(document=document),
+    )
+
+
+# --- подделка YouTube ---
+
+class FakeYouTubeServer:
+    """
+    Локальный resumable-эндпоинт videos.insert.
+    error_rate — доля чанков с ответом 503, drop_rate — доля чанков с оборванным
+    соединением, quota_errors — сколько первых videos.insert получат quotaExceeded.
+    """
+
+    def __init__(self, error_rate: float = 0, drop_rate: float = 0, quota_errors: int = 0,
+                 bandwidth: int = 0, latency: float = 0, seed: int = 0):
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.quota_left = quota_errors
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.sessions: dict[str, list] = {}  # id -> [принято байт, размер или None]
+        self.stats = {"inserts": 0, "chunks": 0, "errors": 0, "drops": 0, "quota": 0, "bytes": 0}
+        self.lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.port}/"
+
+    def start(self) -> "FakeYouTubeServer":
+        self._server = _QuietHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-youtube", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def roll(self) -> str | None:
+        with self.lock:
+            value = self.random.random()
+        if value < self.drop_rate:
+            return "drop"
+        if value < self.drop_rate + self.error_rate:
+            return "error"
+        return None
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Оборванные клиентом соединения — ожидаемая часть сценария, не печатаем трейсбек
+        if not isinstance(sys.exc_info()[1], (ConnectionError, socket.timeout)):
+            super().handle_error(request, client_address)
+
+
+def _make_handler(server: FakeYouTubeServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _read(self, length: int, limit: int | None = None) -> int:
+            """Читает тело (не сохраняя), с ограничением скорости. Возвращает число байт."""
+            to_read = length if limit is None else min(length, limit)
+            done = 0
+            started = time.monotonic()
+            while done < to_read:
+                piece = self.rfile.read(min(256 * 1024, to_read - done))
+                if not piece:
+                    break
+                done += len(piece)
+                if server.bandwidth:
+                    ahead = done / server.bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+            return done
+
+        def _reply(self, status: int, body: dict | None = None, headers: dict | None = None):
+            data = json.dumps(body).encode() if body is not None else b""
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _progress(self, session_id: str):
+            received, total = server.sessions[session_id]
+            if total is not None and received >= total:
+                video_id = hashlib.sha1(session_id.encode()).hexdigest()[:11]
+                self._reply(200, {"kind": "youtube#video", "id": video_id})
+            else:
+                headers = {"Range": f"bytes=0-{received - 1}"} if received else {}
+                self._reply(308, headers=headers)
+
+        def do_POST(self):
+            self._read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(server.latency)
+            if not self.path.startswith("/upload/youtube/v3/videos"):
+                self._reply(404, {"error": {"code": 404, "message": "not found"}})
+                return
+            with server.lock:
+                quota = server.quota_left > 0
+                if quota:
+                    server.quota_left -= 1
+                    server.stats["quota"] += 1
+                else:
+                    server.stats["inserts"] += 1
+            if quota:
+                self._reply(403, {"error": {"code": 403, "message": "quota", "errors": [
+                    {"domain": "youtube.quota", "reason": "quotaExceeded"}]}})
+                return
+            session_id = uuid.uuid4().hex
+            total = self.headers.get("X-Upload-Content-Length")
+            server.sessions[session_id] = [0, int(total) if total else None]
+            self._reply(200, headers={"Location": f"{server.endpoint}upload/session/{session_id}"})
+
+        def do_PUT(self):
+            session_id = self.path.rsplit("/", 1)[-1]
+            length = int(self.headers.get("Content-Length") or 0)
+            if session_id not in server.sessions:
+                self._read(length)
+                self._reply(404, {"error": {"code": 404, "message": "session not found"}})
+                return
+            time.sleep(server.latency)
+            match = re.fullmatch(r"bytes (\*|(\d+)-(\d+))/(\*|\d+)", self.headers.get("Content-Range", ""))
+            if match is None:
+                self._read(length)
+                self._reply(400, {"error": {"code": 400, "message": "bad Content-Range"}})
+                return
+            _, first, last, total = match.groups()
+            if total != "*":
+                server.sessions[session_id][1] = int(total)
+            if first is None:
+                # Запрос состояния после ошибки
+                self._progress(session_id)
+                return
+
+            fault = server.roll()
+            if fault == "drop":
+                server.stats["drops"] += 1
+                self._read(length, limit=length // 2)
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            received = self._read(length)
+            server.stats["chunks"] += 1
+            if fault == "error" or received < length:
+                server.stats["errors"] += 1
+                self._reply(503, {"error": {"code": 503, "message": "backend error"}})
+                return
+            session = server.sessions[session_id]
+            if int(first) <= session[0]:
+                session[0] = max(session[0], int(last) + 1)
+                server.stats["bytes"] += received
+            self._progress(session_id)
+
+    return Handler
+
+
+def _local_http():
+    """Транспорт без TLS: discovery подставляет https и в адрес локального эндпоинта."""
+    from transport import YouTubeHttp
+
+    class LocalHttp(YouTubeHttp):
+        def request(self, uri, *args, **kwargs):
+            if uri.startswith("https://127.0.0.1:"):
+                uri = "http://" + uri[len("https://"):]
+            return super().request(uri, *args, **kwargs)
+
+    return LocalHttp(timeout=60)
+
+
+# --- прогон ---
+
+def configure_env(args, workdir: str):
+    """Настройки читаются при импорте config, поэтому окружение готовим до импорта модулей проекта."""
+    accounts = [
+        f"bench{i}:{workdir}/client_secrets.json:{workdir}/tokens/bench{i}.json" for i in range(args.accounts)
+    ]
+    os.environ.update({
+        "DB_PATH": os.path.join(workdir, "db.sqlite3"),
+        "DOWNLOAD_DIR": os.path.join(workdir, "downloads"),
+        "LOG_PATH": os.path.join(workdir, "bench.log"),
+        "TELEGRAM_SESSION": os.path.join(workdir, "sessions", "bench.session"),
+        "TELEGRAM_API_ID": "1",
+        "TELEGRAM_API_HASH": "bench",
+        "TG_CHANNELS": "@bench",
+        "ROLE": "all",
+        "TG_NOTIFY_BOT_TOKEN": "",
+        "TG_NOTIFY_CHAT_ID": "",
+        "YOUTUBE_ACCOUNTS": ",".join(accounts),
+        "YOUTUBE_CHANNEL_ACCOUNTS": "",
+        "YOUTUBE_DAILY_QUOTA": str(10 ** 9),
+        "LOG_LEVEL": args.log_level,
+    })
+    os.makedirs(os.environ["DOWNLOAD_DIR"], exist_ok=True)
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_file():
+                    total += entry.stat().st_blocks * 512
+            except FileNotFoundError:
+                pass
+    return total
+
+
+async def run(args) -> dict:
+    from google.auth.credentials import AnonymousCredentials
+    from googleapiclient.discovery import build
+    from config import settings
+    from db import init_db, close_db
+    from telegram_client import TGClient
+    from youtube_client import YouTubeUploaderPool
+
+    await init_db()
+    youtube = FakeYouTubeServer(args.error_rate, args.drop_rate, args.quota_errors,
+                                args.yt_bandwidth, args.yt_latency, args.seed).start()
+    telegram = FakeTelegram(args.tg_bandwidth, args.tg_latency)
+
+    pool = YouTubeUploaderPool()
+    for uploader in pool.uploaders.values():
+        uploader.creds = AnonymousCredentials()
+        uploader.http_factory = _local_http
+        uploader._service = build(
+            "youtube", "v3", http=_local_http(), static_discovery=True, cache_discovery=False,
+            client_options={"api_endpoint": youtube.endpoint},
+        )
+
+    tg = TGClient(pool)
+    tg.client = telegram
+    tg.downloader.client = telegram
+    tg.downloader._create_sender = telegram.create_sender
+    tg.channel_names[BENCH_CHAT_ID] = "@bench"
+
+    posted: dict[int, float] = {}
+    latencies: list[float] = []
+    failed = 0
+    finished = asyncio.Event()
+    report = tg.pipeline._report
+
+    async def timed_report(job):
+        nonlocal failed
+        if job.yt_id:
+            latencies.append(time.monotonic() - posted[job.message.id])
+        else:
+            failed += 1
+        if len(latencies) + failed >= args.videos:
+            finished.set()
+        await report(job)
+
+    tg.pipeline._report = timed_report
+
+    peak_disk = 0
+
+    async def sample_disk():
+        nonlocal peak_disk
+        while True:
+            peak_disk = max(peak_disk, directory_size(settings.DOWNLOAD_DIR))
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample_disk())
+    await tg.pipeline.start()
+    # Возобновление незавершённых задач из пустой БД не должно подхватить задачи бенчмарка
+    await next(task for task in tg.pipeline._workers if task.get_name() == "resume")
+    started = time.monotonic()
+    try:
+        for message_id in range(1, args.videos + 1):
+            message = make_message(telegram, message_id, args.size)
+            posted[message_id] = time.monotonic()
+            await tg._handle(message)
+            if args.interval:
+                await asyncio.sleep(args.interval)
+        await asyncio.wait_for(finished.wait(), args.timeout)
+    finally:
+        elapsed = time.monotonic() - started
+        sampler.cancel()
+        await tg.pipeline.stop()
+        await close_db()
+        youtube.stop()
+
+    uploaded = len(latencies)
+    return {
+        "videos": args.videos,
+        "size": args.size,
+        "uploaded": uploaded,
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "videos_per_second": round(uploaded / elapsed, 3),
+        "megabytes_per_second": round(uploaded * args.size / elapsed / 1024 ** 2, 3),
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p99": round(percentile(latencies, 99), 3),
+        # ru_maxrss в Linux — KiB; в процессе работает и поддельный сервер YouTube
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_disk_mb": round(peak_disk / 1024 ** 2, 1),
+        "youtube": youtube.stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк конвейера Telegram -> YouTube")
+    parser.add_argument("--videos", type=int, default=10, help="сколько видео в пачке")
+    parser.add_argument("--size", type=parse_size, default="20M", help="размер каждого видео")
+    parser.add_argument("--interval", type=float, default=0, help="пауза между постами, сек (0 — всплеск)")
+    parser.add_argument("--tg-bandwidth", type=parse_size, default="0", help="скорость Telegram на соединение, байт/с")
+    parser.add_argument("--tg-latency", type=float, default=0.0, help="задержка на запрос к Telegram, сек")
+    parser.add_argument("--yt-bandwidth", type=parse_size, default="0", help="скорость приёма YouTube на соединение, байт/с")
+    parser.add_argument("--yt-latency", type=float, default=0.0, help="задержка ответа YouTube, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля чанков с ответом 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="доля чанков с оборванным соединением")
+    parser.add_argument("--quota-errors", type=int, default=0, help="сколько первых videos.insert получат quotaExceeded")
+    parser.add_argument("--accounts", type=int, default=1, help="аккаунтов YouTube в пуле")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=3600)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--workdir", help="каталог для БД и файлов (по умолчанию временный, удаляется)")
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    args = parser.parse_args()
+
+    if args.quota_errors >= args.accounts:
+        # Аккаунт с quotaExceeded ждёт сброса квоты до полуночи по тихоокеанскому времени
+        parser.error("--quota-errors must be less than --accounts")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="tg2yt-bench-")
+    configure_env(args, workdir)
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+        return
+    print(f"Видео: {result['uploaded']}/{result['videos']} загружено, {result['failed']} с ошибкой, "
+          f"по {result['size'] / 1024 ** 2:.1f} MiB")
+    print(f"Время: {result['seconds']} с, {result['videos_per_second']} видео/с, "
+          f"{result['megabytes_per_second']} MiB/с")
+    print(f"Задержка от поста до id: p50 {result['latency_p50']} с, p99 {result['latency_p99']} с")
+    print(f"Пиковый RSS: {result['peak_rss_mb']} MiB, пик на диске: {result['peak_disk_mb']} MiB")
+    print(f"YouTube: {result['youtube']}")
+
+
+if __name__ == "__main__":
+    main()
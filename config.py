@@ -1,5 +1,6 @@
 
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,15 +15,146 @@ class Settings:
     TG_CHANNELS = [c.strip() for c in os.getenv("TG_CHANNELS", "").split(",") if c.strip()]
     TG_NOTIFY_BOT_TOKEN = os.getenv("TG_NOTIFY_BOT_TOKEN", "")
     TG_NOTIFY_CHAT_ID = os.getenv("TG_NOTIFY_CHAT_ID", "")
+    # Уведомления, пришедшие за это окно (сек), склеиваются в одно сообщение
+    NOTIFY_BATCH_WINDOW = float(os.getenv("NOTIFY_BATCH_WINDOW", "2"))
+    NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
 
     DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR", "./data/downloads")
     DB_PATH = os.getenv("DB_PATH", "./data/db.sqlite3")
+    # Строка подключения SQLAlchemy с async-драйвером; по умолчанию SQLite в DB_PATH
+    DB_URL = os.getenv("DB_URL", "") or f"sqlite+aiosqlite:///{DB_PATH}"
     LOG_PATH = os.getenv("LOG_PATH", "./data/tg2yt.log")
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    # Уровни по модулям поверх LOG_LEVEL: "youtube_client=DEBUG,pipeline=WARNING"
+    LOG_LEVELS = {
+        k.strip(): v.strip().upper() for k, v in (
+            m.split("=", 1) for m in os.getenv("LOG_LEVELS", "").split(",") if "=" in m
+        )
+    }
+    # json — одна запись JSON на строку, text — прежний текстовый формат
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+    # Повторяющиеся ошибки (повторы чанков загрузки): не больше BURST записей за WINDOW сек
+    LOG_THROTTLE_WINDOW = float(os.getenv("LOG_THROTTLE_WINDOW", "60"))
+    LOG_THROTTLE_BURST = int(os.getenv("LOG_THROTTLE_BURST", "5"))
+    # Статусы задач пишутся в БД пачками раз в N сек (0 — сразу)
+    DB_WRITE_BEHIND_INTERVAL = float(os.getenv("DB_WRITE_BEHIND_INTERVAL", "0.5"))
+    DB_WRITE_BEHIND_BATCH = int(os.getenv("DB_WRITE_BEHIND_BATCH", "200"))
 
     YOUTUBE_CLIENT_SECRETS = os.getenv("YOUTUBE_CLIENT_SECRETS", "./client_secrets.json")
     YOUTUBE_TOKEN = os.getenv("YOUTUBE_TOKEN", "./data/tokens/token.json")
     YOUTUBE_UPLOAD_PRIVACY = os.getenv("YOUTUBE_UPLOAD_PRIVACY", "private")
 
+    # Несколько аккаунтов: "имя:client_secrets.json:token.json,..." (пусто — один аккаунт выше)
+    YOUTUBE_ACCOUNTS = [
+        tuple(a.strip().split(":", 2)) for a in os.getenv("YOUTUBE_ACCOUNTS", "").split(",") if a.strip()
+    ]
+    # Закрепление каналов за аккаунтами: "@канал=имя,..."
+    YOUTUBE_CHANNEL_ACCOUNTS = dict(
+        m.strip().split("=", 1) for m in os.getenv("YOUTUBE_CHANNEL_ACCOUNTS", "").split(",") if "=" in m
+    )
+    YOUTUBE_DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+    YOUTUBE_UPLOAD_COST = int(os.getenv("YOUTUBE_UPLOAD_COST", "1600"))
+    YOUTUBE_QUOTA_RECHECK = int(os.getenv("YOUTUBE_QUOTA_RECHECK", "600"))
+    # Альбомы: "" — без плейлиста, "new" — плейлист на каждый альбом, иначе id плейлиста
+    YOUTUBE_ALBUM_PLAYLIST = os.getenv("YOUTUBE_ALBUM_PLAYLIST", "")
+
     MAX_TITLE_LENGTH = int(os.getenv("MAX_TITLE_LENGTH", "100"))
 
+    # Метаданные видео: шаблоны str.format (переменные — в enrich.py), теги через запятую
+    YT_HASHTAGS = os.getenv("YT_HASHTAGS", "#paintedclothes #bodypaint #bikini #blonde")
+    YT_TITLE_TEMPLATE = os.getenv("YT_TITLE_TEMPLATE", "{caption_line:.70}{album} {hashtags}")
+    YT_DESCRIPTION_TEMPLATE = os.getenv("YT_DESCRIPTION_TEMPLATE", "{caption}\n\n{hashtags}")
+    YT_TAGS = [t.strip() for t in os.getenv("YT_TAGS", "").split(",") if t.strip()]
+    # JSON с шаблонами по каналам: {"@канал": {"title": ..., "description": ..., "tags": [...], "hashtags": ...}}
+    YT_TEMPLATES_FILE = os.getenv("YT_TEMPLATES_FILE", "")
+
+    # Превью после загрузки: из Telegram или кадр из файла (ffmpeg), отдельно от конвейера
+    ENRICH_THUMBNAILS = os.getenv("ENRICH_THUMBNAILS", "1") == "1"
+    ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", "1"))
+    ENRICH_QUEUE_SIZE = int(os.getenv("ENRICH_QUEUE_SIZE", "100"))
+    ENRICH_MAX_ATTEMPTS = int(os.getenv("ENRICH_MAX_ATTEMPTS", "4"))
+    ENRICH_RETRY_DELAY = int(os.getenv("ENRICH_RETRY_DELAY", "30"))  # сек, удваивается с каждой попыткой
+    # Превью Telegram уже этой ширины — кадр из файла не извлекаем
+    THUMB_MIN_WIDTH = int(os.getenv("THUMB_MIN_WIDTH", "640"))
+
+    # Размер чанка загрузки на YouTube подбирается по скорости (кратно 256 KiB)
+    YT_CHUNK_INITIAL = int(os.getenv("YT_CHUNK_INITIAL", str(4 * 1024 * 1024)))
+    YT_CHUNK_MIN = int(os.getenv("YT_CHUNK_MIN", str(256 * 1024)))
+    YT_CHUNK_MAX = int(os.getenv("YT_CHUNK_MAX", str(128 * 1024 * 1024)))
+    YT_CHUNK_TARGET_SECONDS = float(os.getenv("YT_CHUNK_TARGET_SECONDS", "10"))
+
+    # Сколько ждать остальные элементы альбома (grouped_id), сек
+    ALBUM_WINDOW = float(os.getenv("ALBUM_WINDOW", "1.5"))
+
+    # Конвейер: отдельные стадии скачивания и загрузки
+    DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "2"))
+    UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "2"))
+    DOWNLOAD_QUEUE_SIZE = int(os.getenv("DOWNLOAD_QUEUE_SIZE", "50"))
+    UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "16"))
+    # Потоки для блокирующих запросов к YouTube (общие для всех аккаунтов)
+    YT_UPLOAD_THREADS = int(os.getenv("YT_UPLOAD_THREADS", os.getenv("UPLOAD_CONCURRENCY", "2")))
+    # Транспорт YouTube: таймаут сокета и общий лимит отправки, байт/с (0 — без лимита),
+    # который одновременные загрузки делят поровну; BURST — сколько можно отправить залпом
+    YT_HTTP_TIMEOUT = float(os.getenv("YT_HTTP_TIMEOUT", "60"))
+    YT_UPLOAD_BANDWIDTH = int(os.getenv("YT_UPLOAD_BANDWIDTH", "0"))
+    YT_UPLOAD_BURST = int(os.getenv("YT_UPLOAD_BURST", str(1024 * 1024)))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    # Справедливая очередь загрузки между каналами: "@канал=вес,..." и "@канал=макс. параллельных,..."
+    UPLOAD_CHANNEL_PRIORITY = {
+        k.strip(): float(v) for k, v in (
+            m.split("=", 1) for m in os.getenv("UPLOAD_CHANNEL_PRIORITY", "").split(",") if "=" in m
+        )
+    }
+    UPLOAD_CHANNEL_MAX = {
+        k.strip(): int(v) for k, v in (
+            m.split("=", 1) for m in os.getenv("UPLOAD_CHANNEL_MAX", "").split(",") if "=" in m
+        )
+    }
+    # Внутри канала сначала загружать файлы поменьше
+    UPLOAD_SMALLEST_FIRST = os.getenv("UPLOAD_SMALLEST_FIRST", "0") == "1"
+
+    # Роль процесса: all — всё в одном; listener — только приём постов в таблицу jobs;
+    # worker — только обработка задач из общей БД (их может быть несколько)
+    ROLE = os.getenv("ROLE", "all").lower()
+    # Имя воркера в аренде задач; несколько процессов на одном хосте — разные имена
+    WORKER_ID = os.getenv("WORKER_ID", "") or socket.gethostname()
+    JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+    JOB_HEARTBEAT_INTERVAL = int(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+    # Периодическая догонка пропущенных сообщений, сек (0 — только после переподключения)
+    CATCH_UP_INTERVAL = int(os.getenv("CATCH_UP_INTERVAL", "300"))
+
+    # Backfill истории каналов
+    BACKFILL_PAGE_SIZE = int(os.getenv("BACKFILL_PAGE_SIZE", "100"))
+    BACKFILL_RATE = float(os.getenv("BACKFILL_RATE", "0.2"))  # задач в секунду, 0 — без ограничения
+
+    # Параллельное скачивание больших файлов из Telegram
+    TG_DOWNLOAD_CONNECTIONS = int(os.getenv("TG_DOWNLOAD_CONNECTIONS", "4"))
+    TG_DOWNLOAD_PART_SIZE = int(os.getenv("TG_DOWNLOAD_PART_SIZE", str(512 * 1024)))
+    TG_PARALLEL_MIN_SIZE = int(os.getenv("TG_PARALLEL_MIN_SIZE", str(10 * 1024 * 1024)))
+
+    # Место в DOWNLOAD_DIR: бюджет на файлы конвейера и минимум свободного места на диске
+    DISK_BUDGET = int(os.getenv("DISK_BUDGET", str(20 * 1024 ** 3)))
+    DISK_MIN_FREE = int(os.getenv("DISK_MIN_FREE", str(1024 ** 3)))
+    DISK_CLEANUP_INTERVAL = int(os.getenv("DISK_CLEANUP_INTERVAL", "600"))
+    DISK_ORPHAN_MAX_AGE = int(os.getenv("DISK_ORPHAN_MAX_AGE", str(24 * 3600)))
+
+    # Подготовка файла перед загрузкой (ffprobe/ffmpeg): remux в faststart MP4 или перекодирование
+    MEDIA_STAGE = os.getenv("MEDIA_STAGE", "0") == "1"
+    MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "1"))
+    MEDIA_QUEUE_SIZE = int(os.getenv("MEDIA_QUEUE_SIZE", "4"))
+    MEDIA_TIMEOUT = int(os.getenv("MEDIA_TIMEOUT", "3600"))
+    MEDIA_X264_PRESET = os.getenv("MEDIA_X264_PRESET", "veryfast")
+
+    # Потоковый режим: Telegram -> YouTube без полного файла на диске
+    STREAM_UPLOAD = os.getenv("STREAM_UPLOAD", "0") == "1"
+    STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(8 * 1024 * 1024)))
+    STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", str(32 * 1024 * 1024)))
+
+    # Метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
 settings = Settings()
@@ -1,15 +1,52 @@
+import asyncio
 import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, UniqueConstraint
-from sqlalchemy.orm import declarative_base, sessionmaker
+import os
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import (
+    event, select, update, delete, func, exists, or_, Column, Integer, BigInteger, String, DateTime, Float, Text,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base, aliased
 from config import settings
+from dedup import DedupIndex
+from logger_setup import get_logger
+from metrics import DB_SECONDS
+
+logger = get_logger("db")
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+# WAL: чтения не ждут записи; synchronous=NORMAL в WAL не теряет данные при падении процесса
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",      # 16 MiB
+    "PRAGMA mmap_size=134217728",    # 128 MiB
+)
 
 Base = declarative_base()
-engine = create_engine(
-    f"sqlite:///{settings.DB_PATH}",
-    connect_args={"check_same_thread": False},
+engine = create_async_engine(
+    settings.DB_URL,
     echo=False  # можно включить True для отладки SQL
 )
-SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
+dedup_index = DedupIndex()
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if engine.dialect.name != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
 
 
 class UploadedVideo(Base):
@@ -17,7 +54,7 @@ class UploadedVideo(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     tg_message_id = Column(Integer, nullable=False)  # используем INTEGER, чтобы совпадал с Telegram ID
-    tg_chat = Column(Integer, nullable=False)        # используем INTEGER для chat_id
+    tg_chat = Column(BigInteger, nullable=False)     # используем INTEGER для chat_id
     tg_post_text = Column(Text, nullable=True)
     file_path = Column(String, nullable=False)
     yt_video_id = Column(String, nullable=True)
@@ -28,55 +65,517 @@ class UploadedVideo(Base):
     )
 
 
-def init_db():
-    """Создание таблиц, если их нет"""
-    Base.metadata.create_all(bind=engine)
+# Статусы задач конвейера
+JOB_PENDING = "pending"        # ждёт скачивания
+JOB_DOWNLOADED = "downloaded"  # файл скачан, ждёт загрузки на YouTube
+JOB_DONE = "done"
+JOB_FAILED = "failed"
 
 
-def record_upload(tg_message_id: int, tg_chat: int, post_text: str, path: str, yt_video_id: str | None = None):
-    s = SessionLocal()
-    try:
-        # Проверяем, есть ли запись
-        existing = s.query(UploadedVideo).filter_by(tg_message_id=int(tg_message_id),
-                                                    tg_chat=int(tg_chat)).first()
-        if existing:
-            # Обновляем yt_video_id и путь, если уже есть
-            existing.yt_video_id = yt_video_id
-            existing.file_path = path
-            existing.tg_post_text = post_text or ""
-            s.commit()
-            return existing
+class Job(Base):
+    """Задача конвейера: одно видео из Telegram на пути к YouTube."""
+    __tablename__ = "jobs"
 
-        # Если нет — создаём новую запись
-        item = UploadedVideo(
-            tg_message_id=int(tg_message_id),
-            tg_chat=int(tg_chat),
-            tg_post_text=post_text or "",
-            file_path=path,
-            yt_video_id=yt_video_id
+    id = Column(Integer, primary_key=True, index=True)
+    tg_message_id = Column(Integer, nullable=False)
+    tg_chat = Column(BigInteger, nullable=False)
+    tg_post_text = Column(Text, nullable=True)
+    file_path = Column(String, nullable=True)
+    tg_document_id = Column(BigInteger, nullable=True, index=True)
+    tg_grouped_id = Column(BigInteger, nullable=True)  # альбом: номер в нём и размер нужны для заголовка
+    album_index = Column(Integer, nullable=True)
+    album_size = Column(Integer, nullable=True)
+    status = Column(String, nullable=False, default=JOB_PENDING, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    yt_video_id = Column(String, nullable=True)
+    stage = Column(String, nullable=True)  # download / media / upload — где задача сейчас
+    downloaded_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    download_seconds = Column(Float, nullable=True)
+    upload_seconds = Column(Float, nullable=True)
+    lease_owner = Column(String, nullable=True)  # WORKER_ID процесса, который ведёт задачу
+    lease_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('tg_message_id', 'tg_chat', name='uix_job_message_chat'),
+    )
+
+
+class MediaContent(Base):
+    """
+    Идентичность содержимого: один и тот же файл в разных каналах и репостах.
+    Ключ — document.id из Telegram, запасной ключ — sha256 байтов.
+    """
+    __tablename__ = "media_content"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tg_document_id = Column(BigInteger, nullable=True, unique=True)
+    tg_access_hash = Column(BigInteger, nullable=True)
+    sha256 = Column(String(64), nullable=True, index=True)
+    yt_video_id = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class ChannelState(Base):
+    """
+    Прогресс по каналу: до какого сообщения дошёл backfill истории
+    и последнее обработанное живое сообщение (для догонки после обрыва).
+    """
+    __tablename__ = "channel_state"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tg_chat = Column(BigInteger, nullable=False, unique=True)
+    backfill_max_id = Column(Integer, nullable=False, default=0)
+    last_message_id = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+
+class YouTubeQuota(Base):
+    """Израсходованная за сутки квота YouTube API по аккаунтам."""
+    __tablename__ = "youtube_quota"
+
+    id = Column(Integer, primary_key=True, index=True)
+    account = Column(String, nullable=False)
+    day = Column(String(10), nullable=False)  # дата по тихоокеанскому времени, YYYY-MM-DD
+    units_used = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('account', 'day', name='uix_quota_account_day'),
+    )
+
+
+class UploadSession(Base):
+    """Resumable-сессия YouTube и подтверждённое смещение — для продолжения загрузки."""
+    __tablename__ = "upload_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_key = Column(String, nullable=False, unique=True)
+    resumable_uri = Column(Text, nullable=False)
+    offset = Column(BigInteger, nullable=False, default=0)
+    chunk_size = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+
+
+class JobUpdateBatcher:
+    """
+    Write-behind для статусов задач: изменения копятся в памяти (по задаче
+    побеждает последнее значение поля) и раз в interval секунд или при
+    max_pending задачах пишутся в БД одной транзакцией.
+    Если процесс упадёт до записи, задача при возобновлении повторится, но
+    загруженное видео найдётся в media_content/uploaded_videos — они пишутся сразу.
+    """
+
+    def __init__(self, interval: float, max_pending: int):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: dict[int, dict] = {}
+        self._task: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._lock = asyncio.Lock()
+
+    def add(self, job_id: int, fields: dict):
+        self._pending.setdefault(job_id, {}).update(fields)
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="db-write-behind")
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception("Failed to write job updates: %s", e)
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            now = datetime.datetime.utcnow()
+            with DB_SECONDS.time(op="flush_job_updates"):
+                async with SessionLocal() as s:
+                    try:
+                        for job_id, fields in pending.items():
+                            await s.execute(update(Job).where(Job.id == job_id, _lease_held())
+                                            .values(updated_at=now, **fields))
+                        await s.commit()
+                    except Exception:
+                        await s.rollback()
+                        # Возвращаем в очередь, не затирая изменения, пришедшие во время записи
+                        for job_id, fields in pending.items():
+                            self._pending[job_id] = {**fields, **self._pending.get(job_id, {})}
+                        raise
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+job_updates = JobUpdateBatcher(settings.DB_WRITE_BEHIND_INTERVAL, settings.DB_WRITE_BEHIND_BATCH)
+
+
+async def init_db():
+    """Миграции Alembic до последней версии и загрузка индекса дедупликации"""
+    async with engine.begin() as conn:
+        await conn.run_sync(_upgrade)
+    await load_dedup_index()
+
+
+def _upgrade(connection):
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    config.attributes["connection"] = connection
+    command.upgrade(config, "head")
+
+
+async def close_db():
+    """Дописывает отложенные изменения и закрывает соединения."""
+    await job_updates.close()
+    await engine.dispose()
+
+
+async def load_dedup_index():
+    """Читает все (chat, message_id) из uploaded_videos в память одним проходом."""
+    dedup_index.clear()
+    async with engine.connect() as conn:
+        result = await conn.stream(
+            select(UploadedVideo.tg_chat, UploadedVideo.tg_message_id).execution_options(yield_per=10_000)
         )
-        s.add(item)
-        s.commit()
-        return item
-    except Exception:
-        s.rollback()
-        raise
-    finally:
-        s.close()
+        async for rows in result.partitions():
+            dedup_index.add_many(rows)
+    dedup_index.loaded = True
+
+
+def _insert(model):
+    """INSERT ... ON CONFLICT в диалекте текущей БД (SQLite или PostgreSQL)."""
+    return (postgresql if engine.dialect.name == "postgresql" else sqlite).insert(model)
+
 
+def _lease_until() -> datetime.datetime:
+    return datetime.datetime.utcnow() + datetime.timedelta(seconds=settings.JOB_LEASE_SECONDS)
 
-def already_uploaded(tg_message_id: int, tg_chat: int) -> bool:
+
+def _lease_held():
+    """Задачу меняет только её арендатор: воркер, потерявший аренду, не затрёт чужой статус."""
+    return or_(Job.lease_owner.is_(None), Job.lease_owner == settings.WORKER_ID)
+
+
+def _unfinished(job, max_attempts: int):
+    return job.status.in_([JOB_PENDING, JOB_DOWNLOADED]) | (
+        (job.status == JOB_FAILED) & (job.attempts < max_attempts)
+    )
+
+
+async def _execute(statement):
+    async with SessionLocal() as s:
+        try:
+            result = await s.execute(statement)
+            await s.commit()
+            return result
+        except Exception:
+            await s.rollback()
+            raise
+
+
+@DB_SECONDS.timed(op="record_upload")
+async def record_upload(tg_message_id: int, tg_chat: int, post_text: str, path: str, yt_video_id: str | None = None):
+    """Одна запись на сообщение: INSERT ... ON CONFLICT (tg_message_id, tg_chat) DO UPDATE."""
+    stmt = _insert(UploadedVideo).values(
+        tg_message_id=int(tg_message_id),
+        tg_chat=int(tg_chat),
+        tg_post_text=post_text or "",
+        file_path=path,
+        yt_video_id=yt_video_id,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UploadedVideo.tg_message_id, UploadedVideo.tg_chat],
+        set_={
+            "yt_video_id": stmt.excluded.yt_video_id,
+            "file_path": stmt.excluded.file_path,
+            "tg_post_text": stmt.excluded.tg_post_text,
+        },
+    )
+    await _execute(stmt)
+    dedup_index.add(tg_chat, tg_message_id)
+
+
+@DB_SECONDS.timed(op="already_uploaded")
+async def already_uploaded(tg_message_id: int, tg_chat: int) -> bool:
     """
     Проверяет, было ли сообщение уже загружено.
-    Работает только по базе данных, без файлов и кеша.
+    После init_db отвечает из индекса в памяти, без обращения к БД.
     """
-    s = SessionLocal()
-    try:
+    if dedup_index.loaded:
+        return dedup_index.contains(tg_chat, tg_message_id)
+
+    async with SessionLocal() as s:
         # Явное сравнение как INTEGER
-        exists = s.query(UploadedVideo).filter_by(
+        row = await s.scalar(select(UploadedVideo.id).filter_by(
             tg_message_id=int(tg_message_id),
             tg_chat=int(tg_chat)
-        ).first() is not None
-        return exists
-    finally:
-        s.close()
+        ).limit(1))
+        return row is not None
+
+
+@DB_SECONDS.timed(op="already_uploaded_many")
+async def already_uploaded_many(tg_chat: int, tg_message_ids: list[int]) -> set[int]:
+    """Пакетная проверка: возвращает те message_id из списка, что уже загружены."""
+    if dedup_index.loaded:
+        return dedup_index.contains_many(tg_chat, tg_message_ids)
+
+    async with SessionLocal() as s:
+        rows = await s.scalars(select(UploadedVideo.tg_message_id).where(
+            UploadedVideo.tg_chat == int(tg_chat),
+            UploadedVideo.tg_message_id.in_([int(m) for m in tg_message_ids]),
+        ))
+        return set(rows)
+
+
+@DB_SECONDS.timed(op="create_job")
+async def create_job(tg_message_id: int, tg_chat: int, post_text: str, path: str,
+                     owner: str | None = None, **fields) -> Job | None:
+    """
+    Создаёт задачу для сообщения; с owner — сразу в аренде у этого процесса,
+    без owner — свободной, её заберёт один из воркеров.
+    Возвращает None, если задача для этого сообщения уже есть.
+    """
+    async with SessionLocal() as s:
+        try:
+            job = Job(
+                tg_message_id=int(tg_message_id),
+                tg_chat=int(tg_chat),
+                tg_post_text=post_text or "",
+                file_path=path,
+                status=JOB_PENDING,
+                lease_owner=owner,
+                lease_expires_at=_lease_until() if owner else None,
+                **fields,
+            )
+            s.add(job)
+            await s.commit()
+            return job
+        except IntegrityError:
+            await s.rollback()
+            return None
+        except Exception:
+            await s.rollback()
+            raise
+
+
+@DB_SECONDS.timed(op="update_job")
+async def update_job(job_id: int, **fields) -> None:
+    """Изменения уходят в write-behind; DB_WRITE_BEHIND_INTERVAL=0 — сразу в БД."""
+    if job_updates.interval > 0:
+        job_updates.add(job_id, fields)
+        return
+    await _execute(update(Job).where(Job.id == job_id, _lease_held()).values(**fields))
+
+
+@DB_SECONDS.timed(op="unfinished_jobs")
+async def unfinished_jobs(max_attempts: int) -> list[Job]:
+    """Незавершённые задачи всех воркеров (в порядке создания)."""
+    await job_updates.flush()
+    async with SessionLocal() as s:
+        rows = await s.scalars(select(Job).where(_unfinished(Job, max_attempts)).order_by(Job.id))
+        return list(rows)
+
+
+@DB_SECONDS.timed(op="claim_jobs")
+async def claim_jobs(owner: str, max_attempts: int, limit: int | None = None,
+                     reclaim_own: bool = False, exclude: set[int] = frozenset()) -> list[Job]:
+    """
+    Берёт в аренду незавершённые задачи: без арендатора или с истёкшей арендой,
+    с reclaim_own — и свои (после перезапуска процесса).
+    Задача не выдаётся, пока тот же документ Telegram ведёт другой воркер:
+    когда тот закончит, она закроется как дубликат, а не загрузится второй раз.
+    Отбор и захват — один UPDATE, поэтому два воркера не получат одну задачу.
+    """
+    await job_updates.flush()
+    now = datetime.datetime.utcnow()
+    job, other = aliased(Job), aliased(Job)
+
+    def free(j):
+        condition = j.lease_owner.is_(None) | (j.lease_expires_at < now)
+        return condition | (j.lease_owner == owner) if reclaim_own else condition
+
+    busy = exists().where(
+        other.tg_document_id == job.tg_document_id,
+        other.id != job.id,
+        other.status.in_([JOB_PENDING, JOB_DOWNLOADED]),
+        other.lease_owner != owner,
+        other.lease_expires_at >= now,
+    )
+    candidates = (
+        select(job.id)
+        .where(_unfinished(job, max_attempts), free(job), ~busy)
+        .order_by((job.lease_owner == owner).desc(), job.id)
+        .with_for_update(skip_locked=True)
+    )
+    if exclude:
+        candidates = candidates.where(job.id.not_in(exclude))
+    if limit is not None:
+        candidates = candidates.limit(limit)
+
+    async with SessionLocal() as s:
+        try:
+            rows = await s.scalars(
+                update(Job)
+                .where(Job.id.in_(candidates), free(Job))
+                .values(lease_owner=owner, lease_expires_at=_lease_until(), updated_at=now)
+                .returning(Job)
+                .execution_options(synchronize_session=False)
+            )
+            jobs = sorted(rows, key=lambda j: j.id)
+            await s.commit()
+            return jobs
+        except Exception:
+            await s.rollback()
+            raise
+
+
+@DB_SECONDS.timed(op="renew_leases")
+async def renew_leases(owner: str, job_ids: set[int]) -> set[int]:
+    """Продлевает аренду; возвращает задачи, которые всё ещё за owner."""
+    async with SessionLocal() as s:
+        try:
+            rows = await s.scalars(
+                update(Job)
+                .where(Job.id.in_(job_ids), Job.lease_owner == owner)
+                .values(lease_expires_at=_lease_until())
+                .returning(Job.id)
+                .execution_options(synchronize_session=False)
+            )
+            kept = set(rows)
+            await s.commit()
+            return kept
+        except Exception:
+            await s.rollback()
+            raise
+
+
+@DB_SECONDS.timed(op="get_upload_session")
+async def get_upload_session(session_key: str) -> UploadSession | None:
+    async with SessionLocal() as s:
+        return await s.scalar(select(UploadSession).filter_by(session_key=session_key))
+
+
+@DB_SECONDS.timed(op="save_upload_session")
+async def save_upload_session(session_key: str, resumable_uri: str, offset: int, chunk_size: int) -> None:
+    stmt = _insert(UploadSession).values(session_key=session_key, resumable_uri=resumable_uri,
+                                        offset=offset, chunk_size=chunk_size)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UploadSession.session_key],
+        set_={
+            "resumable_uri": stmt.excluded.resumable_uri,
+            "offset": stmt.excluded.offset,
+            "chunk_size": stmt.excluded.chunk_size,
+            "updated_at": datetime.datetime.utcnow(),
+        },
+    )
+    await _execute(stmt)
+
+
+@DB_SECONDS.timed(op="delete_upload_session")
+async def delete_upload_session(session_key: str) -> None:
+    await _execute(delete(UploadSession).where(UploadSession.session_key == session_key))
+
+
+@DB_SECONDS.timed(op="find_upload_sessions")
+async def find_upload_sessions(prefix: str) -> list[UploadSession]:
+    """Сессии с ключом, начинающимся с prefix; свежие первыми."""
+    async with SessionLocal() as s:
+        result = await s.scalars(
+            select(UploadSession)
+            .where(UploadSession.session_key.startswith(prefix, autoescape=True))
+            .order_by(UploadSession.updated_at.desc())
+        )
+        return list(result)
+
+
+@DB_SECONDS.timed(op="delete_upload_sessions")
+async def delete_upload_sessions(prefix: str) -> None:
+    """Все сессии с ключом, начинающимся с prefix (например, сессии задачи на разных аккаунтах)."""
+    await _execute(delete(UploadSession).where(UploadSession.session_key.startswith(prefix, autoescape=True)))
+
+
+@DB_SECONDS.timed(op="find_content")
+async def find_content(document_id: int | None = None, sha256: str | None = None) -> MediaContent | None:
+    """Ищет уже загруженное на YouTube содержимое по document.id или по хешу."""
+    async with SessionLocal() as s:
+        query = select(MediaContent).where(MediaContent.yt_video_id.isnot(None))
+        if document_id is not None:
+            found = await s.scalar(query.where(MediaContent.tg_document_id == int(document_id)).limit(1))
+            if found or sha256 is None:
+                return found
+        if sha256 is not None:
+            return await s.scalar(query.where(MediaContent.sha256 == sha256).limit(1))
+        return None
+
+
+@DB_SECONDS.timed(op="save_content")
+async def save_content(document_id: int | None, access_hash: int | None, sha256: str | None,
+                       yt_video_id: str | None = None) -> None:
+    """Добавляет или дополняет запись о содержимом (пустые значения не затирают старые)."""
+    stmt = _insert(MediaContent).values(
+        tg_document_id=int(document_id) if document_id is not None else None,
+        tg_access_hash=access_hash,
+        sha256=sha256,
+        yt_video_id=yt_video_id,
+    )
+    if document_id is not None:
+        table = MediaContent.__table__
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MediaContent.tg_document_id],
+            set_={
+                name: func.coalesce(stmt.excluded[name], table.c[name])
+                for name in ("tg_access_hash", "sha256", "yt_video_id")
+            },
+        )
+    await _execute(stmt)
+
+
+@DB_SECONDS.timed(op="get_channel_state")
+async def get_channel_state(tg_chat: int) -> ChannelState | None:
+    async with SessionLocal() as s:
+        return await s.scalar(select(ChannelState).filter_by(tg_chat=int(tg_chat)))
+
+
+@DB_SECONDS.timed(op="save_channel_state")
+async def save_channel_state(tg_chat: int, **fields) -> None:
+    stmt = _insert(ChannelState).values(tg_chat=int(tg_chat), **fields)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ChannelState.tg_chat],
+        set_={**fields, "updated_at": datetime.datetime.utcnow()},
+    )
+    await _execute(stmt)
+
+
+@DB_SECONDS.timed(op="quota_used")
+async def quota_used(account: str, day: str) -> int:
+    async with SessionLocal() as s:
+        used = await s.scalar(select(YouTubeQuota.units_used).filter_by(account=account, day=day))
+        return used or 0
+
+
+@DB_SECONDS.timed(op="add_quota_usage")
+async def add_quota_usage(account: str, day: str, units: int) -> None:
+    stmt = _insert(YouTubeQuota).values(account=account, day=day, units_used=units)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[YouTubeQuota.account, YouTubeQuota.day],
+        set_={"units_used": YouTubeQuota.units_used + stmt.excluded.units_used},
+    )
+    await _execute(stmt)
@@ -0,0 +1,49 @@
+import threading
+from typing import Iterable
+
+
+class DedupIndex:
+    """
+    Множество уже загруженных пар (chat, message_id) в памяти.
+    ID сообщений в канале идут подряд, поэтому на каждый чат хранится
+    битовая карта: 1 бит на сообщение, проверка за O(1) без обращения к БД.
+    """
+
+    def __init__(self):
+        self._bitmaps: dict[int, bytearray] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def add(self, chat: int, message_id: int):
+        message_id = int(message_id)
+        if message_id < 0:
+            return
+        byte, bit = divmod(message_id, 8)
+        with self._lock:
+            bitmap = self._bitmaps.get(int(chat))
+            if bitmap is None:
+                bitmap = self._bitmaps[int(chat)] = bytearray()
+            if byte >= len(bitmap):
+                # Растём с запасом, чтобы не копировать карту на каждое новое сообщение
+                bitmap.extend(bytes(max(byte + 1 - len(bitmap), len(bitmap) // 4, 1024)))
+            bitmap[byte] |= 1 << bit
+
+    def add_many(self, pairs: Iterable[tuple[int, int]]):
+        for chat, message_id in pairs:
+            self.add(chat, message_id)
+
+    def contains(self, chat: int, message_id: int) -> bool:
+        bitmap = self._bitmaps.get(int(chat))
+        message_id = int(message_id)
+        if bitmap is None or message_id < 0:
+            return False
+        byte, bit = divmod(message_id, 8)
+        return byte < len(bitmap) and bool(bitmap[byte] & (1 << bit))
+
+    def contains_many(self, chat: int, message_ids: Iterable[int]) -> set[int]:
+        return {int(m) for m in message_ids if self.contains(chat, m)}
+
+    def clear(self):
+        with self._lock:
+            self._bitmaps.clear()
+            self.loaded = False
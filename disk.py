@@ -0,0 +1,99 @@
+import asyncio
+import os
+import shutil
+import time
+from logger_setup import get_logger
+
+logger = get_logger("disk")
+
+# Файлы, которые создаёт конвейер: tg_<chat>_<msg>.mp4 и подготовленные tg_<chat>_<msg>.yt.mp4 / .yt.webm
+FILE_PREFIX = "tg_"
+FILE_SUFFIXES = (".mp4", ".webm")
+
+
+class DiskBudget:
+    """
+    Учёт места в каталоге скачиваний.
+    Перед скачиванием задача резервирует размер документа; если резерв не
+    помещается в бюджет (или на диске мало свободного места), задача ждёт,
+    пока другие задачи не освободят место.
+    """
+
+    def __init__(self, directory: str, budget: int, min_free: int = 0):
+        self.directory = directory
+        self.budget = budget
+        self.min_free = min_free
+        self._reserved: dict[str, tuple[int, set[str]]] = {}  # ключ -> (байты, пути задачи)
+        self._cond = asyncio.Condition()
+
+    def _files(self) -> dict[str, os.stat_result]:
+        files = {}
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.startswith(FILE_PREFIX) and entry.name.endswith(FILE_SUFFIXES):
+                        files[os.path.abspath(entry.path)] = entry.stat()
+        except FileNotFoundError:
+            pass
+        return files
+
+    def usage(self) -> int:
+        """Резервы активных задач плюс файлы на диске, не принадлежащие ни одному резерву."""
+        files = self._files()
+        owned = set()
+        total = 0
+        for size, paths in self._reserved.values():
+            owned |= paths
+            total += max(size, sum(files[p].st_size for p in paths if p in files))
+        return total + sum(st.st_size for path, st in files.items() if path not in owned)
+
+    def _fits(self, size: int) -> bool:
+        if not self._reserved:
+            # Ничего не скачивается — пропускаем даже файл больше бюджета, иначе он не пройдёт никогда
+            return True
+        if self.usage() + size > self.budget:
+            return False
+        free = shutil.disk_usage(self.directory).free
+        return free - size >= self.min_free
+
+    async def reserve(self, key: str, size: int, paths: set[str]):
+        async with self._cond:
+            if not self._fits(size):
+                logger.info(f"Waiting for disk space: {size} bytes for {key}")
+                await self._cond.wait_for(lambda: self._fits(size))
+            self._reserved[key] = (size, {os.path.abspath(p) for p in paths})
+
+    async def release(self, key: str):
+        async with self._cond:
+            if self._reserved.pop(key, None) is not None:
+                self._cond.notify_all()
+
+    async def cleanup(self, protected: set[str], max_age: float):
+        """
+        Удаляет файлы без незавершённой задачи: старше max_age — всегда,
+        остальные — от давно не использовавшихся, пока не уложимся в бюджет.
+        """
+        async with self._cond:
+            protected = {os.path.abspath(p) for p in protected}
+            for _, paths in self._reserved.values():
+                protected |= paths
+            orphans = sorted(
+                (max(st.st_atime, st.st_mtime), path, st.st_size)
+                for path, st in self._files().items() if path not in protected
+            )
+            usage = self.usage()
+            now = time.time()
+            removed = 0
+            for used_at, path, size in orphans:
+                if now - used_at < max_age and usage <= self.budget:
+                    break
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Failed to remove orphaned file {path}: {e}")
+                    continue
+                usage -= size
+                removed += 1
+            if removed:
+                logger.info(f"Removed {removed} orphaned files from {self.directory}")
+                self._cond.notify_all()
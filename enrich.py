@@ -0,0 +1,268 @@
+import asyncio
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from googleapiclient.errors import HttpError
+from telethon import types
+from config import settings
+from logger_setup import get_logger
+from media import extract_frame
+from metrics import THUMBNAILS
+
+logger = get_logger("enrich")
+
+# Ограничения YouTube: описание до 5000 байт, теги вместе до 500 символов
+MAX_DESCRIPTION_BYTES = 5000
+MAX_TAGS_LENGTH = 500
+# Угловые скобки YouTube не принимает ни в заголовке, ни в описании
+FORBIDDEN = str.maketrans("", "", "<>")
+
+# Превью с размерами; PhotoStrippedSize/PhotoPathSize — только размытые заглушки
+THUMB_TYPES = (types.PhotoSize, types.PhotoSizeProgressive, types.PhotoCachedSize)
+
+
+class _Vars(dict):
+    """Неизвестная переменная шаблона — пустая строка, а не ошибка посреди загрузки."""
+
+    def __missing__(self, key):
+        return ""
+
+
+def video_attributes(document) -> types.DocumentAttributeVideo | None:
+    return next((a for a in getattr(document, "attributes", None) or []
+                 if isinstance(a, types.DocumentAttributeVideo)), None)
+
+
+def best_thumb(document):
+    """Самое большое превью документа в Telegram (None, если его нет)."""
+    thumbs = [t for t in getattr(document, "thumbs", None) or [] if isinstance(t, THUMB_TYPES)]
+    return max(thumbs, key=lambda t: t.w * t.h, default=None)
+
+
+def job_variables(job, channel: str) -> dict:
+    """Переменные для шаблонов метаданных."""
+    caption = job.post_text or ""
+    document = job.document
+    video = video_attributes(document)
+    album_size = job.album.size if job.album else job.album_size
+    date = job.message.date
+    return {
+        "caption": caption,
+        "caption_line": caption.split("\n")[0] if caption else job.filename,
+        "filename": job.filename,
+        "channel": channel,
+        "chat_id": job.chat_id,
+        "message_id": job.message.id,
+        "album": f" ({job.album_index}/{album_size})" if album_size > 1 else "",
+        "album_index": job.album_index,
+        "album_size": album_size,
+        "duration": int(video.duration) if video else 0,
+        "width": video.w if video else 0,
+        "height": video.h if video else 0,
+        "size_mb": round((getattr(document, "size", None) or 0) / 1024 ** 2, 1),
+        "date": date.strftime("%Y-%m-%d") if date else "",
+    }
+
+
+def clean_tags(tags: list[str]) -> list[str]:
+    """Без пустых и повторов, в пределах лимита YouTube (тег с пробелом считается в кавычках)."""
+    result, total = [], 0
+    for tag in tags:
+        tag = " ".join(tag.translate(FORBIDDEN).replace(",", " ").split())
+        if not tag or tag in result:
+            continue
+        cost = len(tag) + (2 if " " in tag else 0) + (1 if result else 0)
+        if total + cost > MAX_TAGS_LENGTH:
+            break
+        result.append(tag)
+        total += cost
+    return result
+
+
+class MetadataTemplates:
+    """
+    Заголовок, описание и теги видео: общие шаблоны YT_*_TEMPLATE
+    и переопределения по каналам из YT_TEMPLATES_FILE.
+    """
+
+    def __init__(self, path: str = None):
+        self.default = {
+            "title": settings.YT_TITLE_TEMPLATE,
+            "description": settings.YT_DESCRIPTION_TEMPLATE,
+            "tags": settings.YT_TAGS,
+            "hashtags": settings.YT_HASHTAGS,
+        }
+        self.channels: dict[str, dict] = {}
+        path = settings.YT_TEMPLATES_FILE if path is None else path
+        if path:
+            with open(path, encoding="utf-8") as f:
+                self.channels = {str(key): value for key, value in json.load(f).items()}
+
+    def template(self, channel_keys: list) -> dict:
+        for key in channel_keys:
+            if str(key) in self.channels:
+                return {**self.default, **self.channels[str(key)]}
+        return self.default
+
+    def render(self, job, channel_keys: list) -> tuple[str, str, list[str]]:
+        """Возвращает (заголовок, описание, теги)."""
+        template = self.template(channel_keys)
+        values = _Vars(job_variables(job, str(channel_keys[0])), hashtags=template["hashtags"])
+        try:
+            title = template["title"].format_map(values)
+            description = template["description"].format_map(values)
+            tags = [tag.format_map(values) for tag in template["tags"]]
+        except (ValueError, AttributeError, IndexError, KeyError) as e:
+            logger.warning(f"Bad metadata template for {channel_keys[0]}: {e}")
+            title, description, tags = values["caption_line"][:70], values["caption"], []
+
+        title = " ".join(title.translate(FORBIDDEN).split()) or job.filename
+        description = description.translate(FORBIDDEN).strip()
+        description = description.encode("utf-8")[:MAX_DESCRIPTION_BYTES].decode("utf-8", errors="ignore")
+        return title, description, clean_tags(tags)
+
+
+@dataclass
+class ThumbnailTask:
+    video_id: str
+    uploader: object  # YouTubeUploader аккаунта, которому принадлежит видео
+    message: types.Message
+    file_path: str | None = None  # файл для кадра; удаляется сразу после извлечения
+    disk_key: str | None = None  # резерв DiskBudget под этот файл, снимается вместе с ним
+    data: bytes | None = None
+    attempts: int = 0
+
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, HttpError):
+        # 403 — у канала нет права на свои превью, 400 — картинка не подошла
+        return error.resp.status >= 500 or error.resp.status in (408, 429)
+    return True
+
+
+class Enricher:
+    """
+    Обогащение уже загруженного видео: превью из Telegram или кадр из файла
+    и thumbnails.set. Своя очередь, свои воркеры и повторы с нарастающей паузой,
+    поэтому задержка загрузки их не включает. Шаблоны метаданных — тоже здесь.
+    """
+
+    def __init__(self, tg, disk=None):
+        self.tg = tg
+        self.disk = disk
+        self.enabled = settings.ENRICH_THUMBNAILS
+        self.can_extract = bool(shutil.which("ffmpeg"))
+        self.templates = MetadataTemplates()
+        self._queue: asyncio.Queue[ThumbnailTask] = asyncio.Queue(maxsize=settings.ENRICH_QUEUE_SIZE)
+        self._tasks: list[asyncio.Task] = []
+        self._retries: set[asyncio.Task] = set()
+
+    def metadata(self, job, channel_keys: list) -> tuple[str, str, list[str]]:
+        return self.templates.render(job, channel_keys)
+
+    def start(self):
+        if self.enabled and not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(), name=f"enrich-{i}")
+                           for i in range(settings.ENRICH_WORKERS)]
+
+    async def stop(self):
+        tasks = self._tasks + list(self._retries)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            await self._discard_file(self._queue.get_nowait())
+
+    def submit(self, video_id: str, uploader, message: types.Message, file_path: str | None = None,
+               disk_key: str | None = None) -> bool:
+        """
+        Ставит превью в очередь и сразу возвращается.
+        True — локальный файл (только этой задачи) нужен для кадра: его и резерв disk_key
+        освободит стадия обогащения, а не конвейер.
+        """
+        if not self.enabled:
+            return False
+        document = getattr(message.media, "document", None)
+        thumb = best_thumb(document)
+        keep = bool(file_path) and os.path.exists(file_path) and self.can_extract and (
+            thumb is None or thumb.w < settings.THUMB_MIN_WIDTH
+        )
+        if not keep and thumb is None:
+            return False
+        try:
+            self._queue.put_nowait(ThumbnailTask(video_id, uploader, message, file_path if keep else None,
+                                                 disk_key if keep else None))
+        except asyncio.QueueFull:
+            logger.warning(f"Enrichment queue is full, thumbnail for {video_id} skipped")
+            THUMBNAILS.inc(outcome="dropped")
+            return False
+        return keep
+
+    async def _worker(self):
+        while True:
+            task = await self._queue.get()
+            try:
+                await self._process(task)
+            except Exception as e:
+                logger.exception("Enrichment worker error: %s", e)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, task: ThumbnailTask):
+        try:
+            data = await self._thumbnail(task)
+            if not data:
+                THUMBNAILS.inc(outcome="none")
+                return
+            await task.uploader.set_thumbnail(task.video_id, data)
+        except Exception as e:
+            task.attempts += 1
+            if task.attempts >= settings.ENRICH_MAX_ATTEMPTS or not _retryable(e):
+                logger.warning(f"Failed to set thumbnail for {task.video_id}: {e}")
+                THUMBNAILS.inc(outcome="failed")
+                return
+            delay = settings.ENRICH_RETRY_DELAY * 2 ** (task.attempts - 1)
+            logger.warning(f"Failed to set thumbnail for {task.video_id} ({e}), retry in {delay}s")
+            retry = asyncio.create_task(self._retry_later(task, delay))
+            self._retries.add(retry)
+            retry.add_done_callback(self._retries.discard)
+            return
+        THUMBNAILS.inc(outcome="set")
+        logger.info(f"Thumbnail set for {task.video_id}")
+
+    async def _retry_later(self, task: ThumbnailTask, delay: float):
+        await asyncio.sleep(delay)
+        await self._queue.put(task)
+
+    async def _thumbnail(self, task: ThumbnailTask) -> bytes | None:
+        """Кадр из файла (если превью Telegram мелкое), иначе превью Telegram."""
+        document = getattr(task.message.media, "document", None)
+        if task.data is None and task.file_path:
+            video = video_attributes(document)
+            at = video.duration * 0.1 if video else 0
+            try:
+                task.data = await asyncio.get_running_loop().run_in_executor(
+                    None, extract_frame, task.file_path, at
+                ) or None
+            except Exception as e:
+                logger.warning(f"Failed to extract a frame from {task.file_path}: {e}")
+            finally:
+                await self._discard_file(task)
+        if task.data is None:
+            thumb = best_thumb(document)
+            if thumb is not None:
+                task.data = await self.tg.download_thumbnail(task.message, thumb)
+        return task.data
+
+    async def _discard_file(self, task: ThumbnailTask):
+        if task.file_path:
+            try:
+                os.remove(task.file_path)
+            except OSError:
+                pass
+            task.file_path = None
+        if task.disk_key and self.disk is not None:
+            await self.disk.release(task.disk_key)
+        task.disk_key = None
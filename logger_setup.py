@@ -1,53 +1,170 @@
+import atexit
+import copy
+import datetime
+import json
 import logging
-from logging.handlers import RotatingFileHandler
-import requests
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from config import settings
+from notify_handler import TelegramLogHandler
 
+ROOT = "tg2yt"
 
-class TelegramLogHandler(logging.Handler):
-    """Отправляет логи в Telegram через Bot API."""
+# Поля задачи, которые попадают в каждую запись: задаются через log_context()
+CONTEXT_FIELDS = ("job_id", "channel", "stage")
+_context: ContextVar[dict] = ContextVar("log_context", default={})
 
-    def __init__(self, bot_token: str, chat_id: str):
+
+@contextmanager
+def log_context(**fields):
+    """Поля job_id/channel/stage для всех записей внутри блока и задач, созданных в нём."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Логгер модуля tg2yt.<name>; его уровень можно задать в LOG_LEVELS."""
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+class ContextFilter(logging.Filter):
+    """Копирует поля контекста в запись — в потоке вызывающего, пока contextvars ещё видны."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Записи с extra={"throttle": ключ} проходят не чаще burst раз за window сек на ключ.
+    Сколько записей отброшено, видно в поле suppressed первой записи следующего окна.
+    """
+
+    def __init__(self, window: float, burst: int):
         super().__init__()
-        self.bot_token = bot_token
-        self.chat_id = chat_id
-
-    def emit(self, record):
-        log_entry = self.format(record)
-        try:
-            requests.post(
-                f"https://api.telegram.org/bot{self.bot_token}/sendMessage",
-                data={"chat_id": self.chat_id, "text": f"⚠️ {log_entry}"},
-                timeout=5,
-            )
-        except Exception:
-            # Не ломаем основной процесс логирования при ошибке сети
-            pass
+        self.window = window
+        self.burst = burst
+        self._lock = threading.Lock()
+        # ключ -> [начало окна, пропущено, отброшено]
+        self._windows: dict[str, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "throttle", None)
+        if key is None or self.window <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                if state and state[2]:
+                    record.suppressed = state[2]
+                state = self._windows[key] = [now, 0, 0]
+            if state[1] >= self.burst:
+                state[2] += 1
+                return False
+            state[1] += 1
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: время, уровень, логгер, текст, поля задачи, traceback."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                  .isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in CONTEXT_FIELDS + ("suppressed",):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Прежний текстовый формат; поля задачи дописываются в конец строки."""
+
+    def __init__(self, fmt: str = "[%(asctime)s] [%(levelname)s] %(message)s"):
+        super().__init__(fmt)
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        text = super().formatMessage(record)
+        fields = [f"{key}={getattr(record, key)}" for key in CONTEXT_FIELDS if getattr(record, key, None) is not None]
+        if getattr(record, "suppressed", None):
+            fields.append(f"suppressed={record.suppressed}")
+        return f"{text} [{' '.join(fields)}]" if fields else text
+
+
+class _QueueHandler(QueueHandler):
+    """Текст и traceback готовятся в потоке вызывающего: аргументы могут измениться, пока запись в очереди."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
 
 def setup_logger():
-    logger = logging.getLogger("tg2yt")
-    logger.setLevel(logging.ERROR)
+    """
+    Вызывающий поток (и event loop) только кладёт запись в очередь;
+    консоль, файл и Telegram пишет QueueListener в своём потоке.
+    """
+    logger = logging.getLogger(ROOT)
+    logger.setLevel(settings.LOG_LEVEL)
+    for name, level in settings.LOG_LEVELS.items():
+        get_logger(name).setLevel(level)
 
-    fmt = logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s")
+    fmt = JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter()
 
     # Консоль
     sh = logging.StreamHandler()
     sh.setFormatter(fmt)
-    logger.addHandler(sh)
 
     # Файл
     fh = RotatingFileHandler(settings.LOG_PATH, maxBytes=5_000_000, backupCount=3, encoding="utf-8")
     fh.setFormatter(fmt)
-    logger.addHandler(fh)
+    handlers = [sh, fh]
 
     # Telegram — только для ошибок и критических логов
     if settings.TG_NOTIFY_BOT_TOKEN and settings.TG_NOTIFY_CHAT_ID:
-        th = TelegramLogHandler(settings.TG_NOTIFY_BOT_TOKEN, settings.TG_NOTIFY_CHAT_ID)
+        th = TelegramLogHandler()
         th.setLevel(logging.ERROR)
-        th.setFormatter(fmt)
-        logger.addHandler(th)
+        th.setFormatter(logging.Formatter("⚠️ [%(asctime)s] [%(levelname)s] %(message)s"))
+        handlers.append(th)
+
+    records: queue.Queue[logging.LogRecord] = queue.Queue()
+    qh = _QueueHandler(records)
+    qh.addFilter(ContextFilter())
+    qh.addFilter(RateLimitFilter(settings.LOG_THROTTLE_WINDOW, settings.LOG_THROTTLE_BURST))
+    logger.addHandler(qh)
 
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    # Дописать очередь при выходе
+    atexit.register(listener.stop)
     return logger
 
 
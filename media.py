@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import shutil
+import struct
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from config import settings
+from logger_setup import get_logger
+
+logger = get_logger("media")
+
+# Что YouTube принимает в MP4 без перекодирования
+MP4_VIDEO_CODECS = {"h264", "hevc", "av1", "mpeg4", "vp9"}
+MP4_AUDIO_CODECS = {"aac", "mp3", "opus", "ac3", "eac3"}
+# WebM, который не переложить в MP4 (VP8, Vorbis), YouTube принимает как есть — под именем .webm
+WEBM_VIDEO_CODECS = {"vp8", "vp9", "av1"}
+WEBM_AUDIO_CODECS = {"opus", "vorbis"}
+
+PASSTHROUGH = "passthrough"
+REMUX = "remux"
+TRANSCODE = "transcode"
+
+PREPARED_SUFFIX = ".yt.mp4"
+WEBM_SUFFIX = ".yt.webm"
+PREPARED_SUFFIXES = (PREPARED_SUFFIX, WEBM_SUFFIX)
+
+
+@dataclass
+class MediaInfo:
+    container: str
+    video_codec: str | None
+    audio_codec: str | None
+    faststart: bool
+
+    @property
+    def is_webm(self) -> bool:
+        return "webm" in self.container.split(",")
+
+    @property
+    def action(self) -> str:
+        if self.video_codec is None:
+            return TRANSCODE
+        codecs_ok = self.video_codec in MP4_VIDEO_CODECS and (
+            self.audio_codec is None or self.audio_codec in MP4_AUDIO_CODECS
+        )
+        if not codecs_ok:
+            webm_ok = self.is_webm and self.video_codec in WEBM_VIDEO_CODECS and (
+                self.audio_codec is None or self.audio_codec in WEBM_AUDIO_CODECS
+            )
+            return PASSTHROUGH if webm_ok else TRANSCODE
+        is_mp4 = any(name in self.container.split(",") for name in ("mov", "mp4"))
+        return PASSTHROUGH if is_mp4 and self.faststart else REMUX
+
+    @property
+    def suffix(self) -> str | None:
+        """Суффикс файла для загрузки; None — исходный файл загружается под своим именем."""
+        if self.action != PASSTHROUGH:
+            return PREPARED_SUFFIX
+        return WEBM_SUFFIX if self.is_webm else None
+
+
+# --- функции для процесса-воркера (должны быть на уровне модуля) ---
+
+def _is_faststart(path: str) -> bool:
+    """moov перед mdat: YouTube может начать обработку, не дочитав файл."""
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return False
+            size, kind = struct.unpack(">I4s", header)
+            if kind == b"moov":
+                return True
+            if kind == b"mdat":
+                return False
+            if size == 1:
+                size = struct.unpack(">Q", f.read(8))[0]
+                f.seek(size - 16, os.SEEK_CUR)
+            elif size == 0:
+                return False
+            else:
+                f.seek(size - 8, os.SEEK_CUR)
+
+
+def probe(path: str) -> MediaInfo:
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+        check=True, capture_output=True, timeout=120,
+    ).stdout
+    data = json.loads(out)
+    streams = data.get("streams", [])
+    video = next((s["codec_name"] for s in streams if s.get("codec_type") == "video"
+                  and not s.get("disposition", {}).get("attached_pic")), None)
+    audio = next((s["codec_name"] for s in streams if s.get("codec_type") == "audio"), None)
+    container = data.get("format", {}).get("format_name", "")
+    faststart = "mp4" in container and _is_faststart(path)
+    return MediaInfo(container, video, audio, faststart)
+
+
+def convert(src: str, dst: str, action: str):
+    if action == REMUX:
+        codec_args = ["-c", "copy"]
+    else:
+        codec_args = ["-c:v", "libx264", "-preset", settings.MEDIA_X264_PRESET, "-crf", "20",
+                      "-c:a", "aac", "-b:a", "160k"]
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-i", src, "-map", "0:v:0", "-map", "0:a:0?",
+         *codec_args, "-movflags", "+faststart", dst],
+        check=True, capture_output=True, timeout=settings.MEDIA_TIMEOUT,
+    )
+
+
+def extract_frame(path: str, at: float, width: int = 1280) -> bytes:
+    """JPEG-кадр на отметке at секунд, не шире width — для превью на YouTube."""
+    return subprocess.run(
+        ["ffmpeg", "-v", "error", "-ss", f"{at:.2f}", "-i", path, "-frames:v", "1",
+         "-vf", f"scale='min({width},iw)':-2", "-q:v", "3", "-f", "image2", "-c:v", "mjpeg", "pipe:1"],
+        check=True, capture_output=True, timeout=120,
+    ).stdout
+
+
+def _link(src: str, dst: str) -> bool:
+    try:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+        return True
+    except OSError:
+        return False
+
+
+class MediaStage:
+    """
+    Подготовка файла перед загрузкой: проверка реального контейнера и кодеков,
+    быстрый remux без перекодирования в faststart MP4 и полное перекодирование
+    только если иначе нельзя. Тяжёлая работа идёт в ограниченном пуле процессов.
+    """
+
+    CACHE_SIZE = 1000
+
+    def __init__(self, workers: int = None):
+        self.enabled = settings.MEDIA_STAGE and bool(shutil.which("ffprobe") and shutil.which("ffmpeg"))
+        if settings.MEDIA_STAGE and not self.enabled:
+            logger.warning("MEDIA_STAGE is on, but ffmpeg/ffprobe not found — media stage disabled")
+        self._executor: ProcessPoolExecutor | None = None
+        self._workers = workers or settings.MEDIA_WORKERS
+        # sha256 содержимого -> (решение, суффикс результата, путь к готовому файлу)
+        self._cache: OrderedDict[str, tuple[str, str | None, str]] = OrderedDict()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self._workers)
+        return self._executor
+
+    async def prepare(self, path: str, content_hash: str | None = None) -> tuple[str, str]:
+        """
+        Возвращает (путь к файлу для загрузки, выполненное действие).
+        Путь всегда свой — от path: файл другой задачи с тем же содержимым могут удалить в любой момент.
+        """
+        base = os.path.splitext(path)[0]
+        action = suffix = None
+        if content_hash and content_hash in self._cache:
+            action, suffix, done = self._cache[content_hash]
+            self._cache.move_to_end(content_hash)
+            if suffix is None:
+                return path, action
+            prepared = base + suffix
+            if action == PASSTHROUGH:
+                return self._rename(path, prepared), action
+            # Готовый результат — жёсткой ссылкой: удаление одного имени не трогает другое
+            if done == prepared and os.path.exists(prepared) or _link(done, prepared):
+                return prepared, action
+
+        loop = asyncio.get_running_loop()
+        if action is None:
+            info = await loop.run_in_executor(self._pool(), probe, path)
+            action, suffix = info.action, info.suffix
+            if action != PASSTHROUGH:
+                logger.info(f"{action} {path} ({info.container}, {info.video_codec}/{info.audio_codec})")
+        prepared = path if suffix is None else base + suffix
+        if action == PASSTHROUGH:
+            prepared = self._rename(path, prepared)
+        else:
+            await loop.run_in_executor(self._pool(), convert, path, prepared, action)
+
+        if content_hash:
+            self._cache[content_hash] = (action, suffix, prepared)
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return prepared, action
+
+    @staticmethod
+    def _rename(path: str, target: str) -> str:
+        """WebM уходит на YouTube как есть, но под своим расширением — иначе он выдан за MP4."""
+        if path != target:
+            os.replace(path, target)
+        return target
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
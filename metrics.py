@@ -0,0 +1,254 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+from config import settings
+from logger_setup import get_logger
+
+logger = get_logger("metrics")
+
+# Границы гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+BYTES_PER_SECOND_BUCKETS = tuple(2 ** p for p in range(16, 31, 2))  # 64 KiB/s .. 1 GiB/s
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._functions: dict[tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, fn: Callable[[], float], **labels):
+        """Значение считается в момент запроса /metrics (например, длина очереди)."""
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def render(self) -> list[str]:
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, fn in functions:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            with self._lock:
+                self._values[key] = value
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple[str, ...], list] = {}  # key -> [счётчики по корзинам..., +Inf, sum]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            data[index] += 1
+            data[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def timed(self, **labels):
+        """Декоратор: время каждого вызова функции (обычной или async)."""
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        self.observe(time.perf_counter() - started, **labels)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, **labels)
+            return wrapper
+        return decorator
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            for key, data in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), data):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {data[-1]}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _NoopMetric:
+    """Метрика-заглушка: при METRICS_ENABLED=0 все вызовы почти ничего не стоят."""
+
+    def inc(self, *args, **kwargs):
+        pass
+
+    def set(self, *args, **kwargs):
+        pass
+
+    def set_function(self, *args, **kwargs):
+        pass
+
+    def observe(self, *args, **kwargs):
+        pass
+
+    @contextmanager
+    def time(self, **labels):
+        yield
+
+    def timed(self, **labels):
+        return lambda fn: fn
+
+
+class Registry:
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._metrics: list[_Metric] = []
+        self._server: ThreadingHTTPServer | None = None
+
+    def _register(self, metric):
+        if not self.enabled:
+            return _NoopMetric()
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host: str, port: int):
+        """Отдаёт метрики на http://host:port/metrics из фонового потока."""
+        if not self.enabled or self._server is not None:
+            return
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        logger.info(f"Metrics available at http://{host}:{port}/metrics")
+
+
+registry = Registry(settings.METRICS_ENABLED)
+
+QUEUE_DEPTH = registry.gauge("tg2yt_queue_depth", "Jobs waiting in a pipeline queue", ("stage",))
+JOBS = registry.counter("tg2yt_jobs_total", "Finished jobs by outcome", ("outcome",))
+DOWNLOAD_BYTES = registry.counter("tg2yt_download_bytes_total", "Bytes downloaded from Telegram")
+DOWNLOAD_SPEED = registry.histogram(
+    "tg2yt_download_bytes_per_second", "Telegram download throughput per file", buckets=BYTES_PER_SECOND_BUCKETS
+)
+UPLOAD_BYTES = registry.counter("tg2yt_upload_bytes_total", "Bytes acknowledged by YouTube", ("account",))
+UPLOAD_CHUNK_SPEED = registry.histogram(
+    "tg2yt_upload_chunk_bytes_per_second", "YouTube upload throughput per next_chunk call",
+    ("account",), buckets=BYTES_PER_SECOND_BUCKETS,
+)
+UPLOAD_RETRIES = registry.counter("tg2yt_upload_retries_total", "Retried YouTube upload chunks", ("account",))
+UPLOAD_THROTTLE_SECONDS = registry.counter(
+    "tg2yt_upload_throttle_seconds_total", "Time upload threads waited for the bandwidth limiter"
+)
+STAGE_SECONDS = registry.histogram("tg2yt_stage_seconds", "Time spent in a pipeline stage", ("stage",))
+END_TO_END_SECONDS = registry.histogram(
+    "tg2yt_end_to_end_seconds", "From Telegram post date to YouTube video id"
+)
+THUMBNAILS = registry.counter("tg2yt_thumbnails_total", "Thumbnail enrichment outcomes", ("outcome",))
+DEDUP_HITS = registry.counter("tg2yt_dedup_hits_total", "Messages skipped as already uploaded", ("kind",))
+DB_SECONDS = registry.histogram("tg2yt_db_seconds", "Database call time", ("op",))
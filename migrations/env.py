@@ -0,0 +1,38 @@
+import asyncio
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy.ext.asyncio import create_async_engine
+from config import settings
+from db import Base
+
+config = context.config
+target_metadata = Base.metadata
+url = settings.DB_URL
+
+
+def run_migrations(connection):
+    # render_as_batch: SQLite не умеет большинство ALTER TABLE
+    context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+connection = config.attributes.get("connection")
+if connection is not None:
+    # Вызов из init_db(): соединение приложения, логирование не трогаем
+    run_migrations(connection)
+elif context.is_offline_mode():
+    context.configure(url=url, target_metadata=target_metadata, literal_binds=True, render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+else:
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+
+    async def run_online():
+        engine = create_async_engine(url)
+        async with engine.connect() as conn:
+            await conn.run_sync(run_migrations)
+        await engine.dispose()
+
+    asyncio.run(run_online())
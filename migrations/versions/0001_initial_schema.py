@@ -0,0 +1,106 @@
+"""initial schema
+
+Таблицы, которые раньше создавал create_all. Для уже существующей БД
+миграция ничего не меняет, только ставит её под контроль Alembic.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "uploaded_videos" not in existing:
+        op.create_table(
+            "uploaded_videos",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("tg_message_id", sa.Integer, nullable=False),
+            sa.Column("tg_chat", sa.Integer, nullable=False),
+            sa.Column("tg_post_text", sa.Text, nullable=True),
+            sa.Column("file_path", sa.String, nullable=False),
+            sa.Column("yt_video_id", sa.String, nullable=True),
+            sa.Column("created_at", sa.DateTime, nullable=True),
+            sa.UniqueConstraint("tg_message_id", "tg_chat", name="uix_message_chat"),
+        )
+        op.create_index("ix_uploaded_videos_id", "uploaded_videos", ["id"])
+
+    if "jobs" not in existing:
+        op.create_table(
+            "jobs",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("tg_message_id", sa.Integer, nullable=False),
+            sa.Column("tg_chat", sa.Integer, nullable=False),
+            sa.Column("tg_post_text", sa.Text, nullable=True),
+            sa.Column("file_path", sa.String, nullable=True),
+            sa.Column("status", sa.String, nullable=False),
+            sa.Column("attempts", sa.Integer, nullable=False),
+            sa.Column("error", sa.Text, nullable=True),
+            sa.Column("yt_video_id", sa.String, nullable=True),
+            sa.Column("created_at", sa.DateTime, nullable=True),
+            sa.Column("updated_at", sa.DateTime, nullable=True),
+            sa.UniqueConstraint("tg_message_id", "tg_chat", name="uix_job_message_chat"),
+        )
+        op.create_index("ix_jobs_id", "jobs", ["id"])
+        op.create_index("ix_jobs_status", "jobs", ["status"])
+
+    if "media_content" not in existing:
+        op.create_table(
+            "media_content",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("tg_document_id", sa.Integer, nullable=True, unique=True),
+            sa.Column("tg_access_hash", sa.Integer, nullable=True),
+            sa.Column("sha256", sa.String(64), nullable=True),
+            sa.Column("yt_video_id", sa.String, nullable=True),
+            sa.Column("created_at", sa.DateTime, nullable=True),
+        )
+        op.create_index("ix_media_content_id", "media_content", ["id"])
+        op.create_index("ix_media_content_sha256", "media_content", ["sha256"])
+
+    if "channel_state" not in existing:
+        op.create_table(
+            "channel_state",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("tg_chat", sa.Integer, nullable=False, unique=True),
+            sa.Column("backfill_max_id", sa.Integer, nullable=False),
+            sa.Column("last_message_id", sa.Integer, nullable=True),
+            sa.Column("updated_at", sa.DateTime, nullable=True),
+        )
+        op.create_index("ix_channel_state_id", "channel_state", ["id"])
+
+    if "youtube_quota" not in existing:
+        op.create_table(
+            "youtube_quota",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("account", sa.String, nullable=False),
+            sa.Column("day", sa.String(10), nullable=False),
+            sa.Column("units_used", sa.Integer, nullable=False),
+            sa.UniqueConstraint("account", "day", name="uix_quota_account_day"),
+        )
+        op.create_index("ix_youtube_quota_id", "youtube_quota", ["id"])
+
+    if "upload_sessions" not in existing:
+        op.create_table(
+            "upload_sessions",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("session_key", sa.String, nullable=False, unique=True),
+            sa.Column("resumable_uri", sa.Text, nullable=False),
+            sa.Column("offset", sa.Integer, nullable=False),
+            sa.Column("chunk_size", sa.Integer, nullable=False),
+            sa.Column("updated_at", sa.DateTime, nullable=True),
+        )
+        op.create_index("ix_upload_sessions_id", "upload_sessions", ["id"])
+
+
+def downgrade():
+    for table in ("upload_sessions", "youtube_quota", "channel_state", "media_content", "jobs", "uploaded_videos"):
+        op.drop_table(table)
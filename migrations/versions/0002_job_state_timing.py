@@ -0,0 +1,36 @@
+"""job stage and timing columns
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    ("stage", sa.String),
+    ("downloaded_at", sa.DateTime),
+    ("finished_at", sa.DateTime),
+    ("download_seconds", sa.Float),
+    ("upload_seconds", sa.Float),
+)
+
+
+def upgrade():
+    # Столбцы могли появиться раньше (create_all новой версией моделей) — добавляем только недостающие
+    existing = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("jobs")}
+    for name, type_ in COLUMNS:
+        if name not in existing:
+            op.add_column("jobs", sa.Column(name, type_, nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("jobs") as batch:
+        for name, _ in COLUMNS:
+            batch.drop_column(name)
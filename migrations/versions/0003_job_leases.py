@@ -0,0 +1,60 @@
+"""job leases for listener/worker split
+
+Аренда задач воркерами, document.id и альбом задачи. В PostgreSQL
+id каналов, документов и смещения загрузки не влезают в INTEGER — там
+они переводятся в BIGINT (в SQLite INTEGER и так 64-битный).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    ("tg_document_id", sa.BigInteger),
+    ("tg_grouped_id", sa.BigInteger),
+    ("album_index", sa.Integer),
+    ("album_size", sa.Integer),
+    ("lease_owner", sa.String),
+    ("lease_expires_at", sa.DateTime),
+)
+
+BIGINT_COLUMNS = (
+    ("uploaded_videos", "tg_chat"),
+    ("jobs", "tg_chat"),
+    ("media_content", "tg_document_id"),
+    ("media_content", "tg_access_hash"),
+    ("channel_state", "tg_chat"),
+    ("upload_sessions", "offset"),
+)
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = {c["name"] for c in inspector.get_columns("jobs")}
+    for name, type_ in COLUMNS:
+        if name not in existing:
+            op.add_column("jobs", sa.Column(name, type_, nullable=True))
+    if "ix_jobs_tg_document_id" not in {i["name"] for i in inspector.get_indexes("jobs")}:
+        op.create_index("ix_jobs_tg_document_id", "jobs", ["tg_document_id"])
+
+    if op.get_bind().dialect.name != "sqlite":
+        for table, column in BIGINT_COLUMNS:
+            op.alter_column(table, column, type_=sa.BigInteger, existing_type=sa.Integer)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        for table, column in BIGINT_COLUMNS:
+            op.alter_column(table, column, type_=sa.Integer, existing_type=sa.BigInteger)
+    op.drop_index("ix_jobs_tg_document_id", table_name="jobs")
+    with op.batch_alter_table("jobs") as batch:
+        for name, _ in COLUMNS:
+            batch.drop_column(name)
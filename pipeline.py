@@ -0,0 +1,692 @@
+import asyncio
+import datetime
+import os
+import time
+from dataclasses import dataclass, field
+from telethon import types
+from telethon.tl.types import PeerChannel
+from config import settings
+from media import MediaStage, PREPARED_SUFFIXES
+from disk import DiskBudget
+from enrich import Enricher
+from scheduler import FairQueue
+from youtube_client import StreamBuffer, TelegramStreamUpload, QuotaExceededError
+from logger_setup import get_logger, log_context
+from metrics import QUEUE_DEPTH, STAGE_SECONDS, END_TO_END_SECONDS, DEDUP_HITS, JOBS
+from db import (
+    create_job, update_job, unfinished_jobs, claim_jobs, renew_leases, record_upload, find_content, save_content,
+    delete_upload_sessions,
+    JOB_DOWNLOADED, JOB_DONE, JOB_FAILED,
+)
+
+logger = get_logger("pipeline")
+
+
+@dataclass
+class Album:
+    """Видео одного альбома Telegram: общая подпись и одно уведомление на всю группу."""
+    grouped_id: int
+    chat_id: int
+    caption: str
+    size: int
+    jobs: list["QueuedJob"] = field(default_factory=list)  # завершённые задачи
+    reported: bool = False
+
+    @property
+    def complete(self) -> bool:
+        return not self.reported and len(self.jobs) >= self.size
+
+
+@dataclass
+class QueuedJob:
+    """Задача в памяти: строка из таблицы jobs + сообщение Telegram."""
+    job_id: int
+    chat_id: int
+    message: types.Message
+    post_text: str
+    file_path: str
+    attempts: int = 0
+    steps: list[str] = field(default_factory=list)
+    content_hash: str | None = None
+    owns_content: bool = False  # задача держит document.id в списке обрабатываемых
+    album: Album | None = None
+    album_index: int = 0
+    album_size: int = 0  # для задач, взятых из БД без объекта Album
+    yt_id: str | None = None
+    account: str | None = None
+    disk_key: str | None = None  # резерв места в DOWNLOAD_DIR
+
+    @property
+    def filename(self) -> str:
+        return os.path.basename(self.file_path)
+
+    @property
+    def document(self) -> types.Document | None:
+        return getattr(self.message.media, "document", None)
+
+
+class Pipeline:
+    """
+    Конвейер: скачивание из Telegram -> (подготовка файла) -> загрузка на YouTube.
+    У каждой стадии свой пул воркеров и ограниченная очередь,
+    поэтому всплеск постов не держит обработчик событий Telethon,
+    а состояние задач хранится в БД и переживает перезапуск.
+
+    Задачи берутся в аренду (lease) на WORKER_ID и продлеваются heartbeat'ом.
+    ROLE=listener только пишет задачи в БД, ROLE=worker забирает свободные
+    и брошенные (аренда истекла) задачи из общей БД, ROLE=all делает всё сам.
+    """
+
+    def __init__(self, tg, yt, notifier):
+        self.tg = tg
+        self.yt = yt
+        self.notifier = notifier
+        # Каналы делят стадии по весам: активный канал не занимает все слоты загрузки
+        self.download_queue: FairQueue[QueuedJob] = FairQueue(
+            settings.DOWNLOAD_QUEUE_SIZE, channel=self._channel_of, size=self._job_size,
+            weight=self._channel_priority,
+        )
+        self.upload_queue: FairQueue[QueuedJob] = FairQueue(
+            settings.UPLOAD_QUEUE_SIZE, channel=self._channel_of, size=self._job_size,
+            weight=self._channel_priority, limit=self._channel_limit,
+            smallest_first=settings.UPLOAD_SMALLEST_FIRST,
+        )
+        self.media = MediaStage()
+        self.media_queue: asyncio.Queue[QueuedJob] = asyncio.Queue(maxsize=settings.MEDIA_QUEUE_SIZE)
+        self.disk = DiskBudget(settings.DOWNLOAD_DIR, settings.DISK_BUDGET, settings.DISK_MIN_FREE)
+        self.enricher = Enricher(tg, self.disk)
+        self._workers: list[asyncio.Task] = []
+        # document.id, которые сейчас скачиваются/загружаются, и ждущие их копии
+        self._inflight: set[int] = set()
+        self._waiting: dict[int, list[QueuedJob]] = {}
+        # Задачи в аренде у этого процесса и те, чью аренду забрал другой воркер
+        self._leases: set[int] = set()
+        self._lost: set[int] = set()
+        # Файлы неудачных задач: повтор их использует, но при нехватке места их можно удалить
+        self._evictable: set[str] = set()
+        # Отложенные возвраты в очередь: без ссылки задачу может собрать сборщик мусора
+        self._requeues: set[asyncio.Task] = set()
+        QUEUE_DEPTH.set_function(self.download_queue.qsize, stage="download")
+        QUEUE_DEPTH.set_function(self.media_queue.qsize, stage="media")
+        QUEUE_DEPTH.set_function(self.upload_queue.qsize, stage="upload")
+
+    async def start(self):
+        if settings.ROLE == "listener":
+            return
+        self.yt.start()
+        self.enricher.start()
+        await self._cleanup_disk()
+        self._workers.append(asyncio.create_task(self._disk_janitor(), name="disk-janitor"))
+        for i in range(settings.DOWNLOAD_CONCURRENCY):
+            self._workers.append(asyncio.create_task(self._worker(self.download_queue, self._download), name=f"download-{i}"))
+        if self.media.enabled:
+            for i in range(settings.MEDIA_WORKERS):
+                self._workers.append(asyncio.create_task(self._worker(self.media_queue, self._prepare), name=f"media-{i}"))
+        for i in range(settings.UPLOAD_CONCURRENCY):
+            self._workers.append(asyncio.create_task(self._worker(self.upload_queue, self._upload), name=f"upload-{i}"))
+        self._workers.append(asyncio.create_task(self._heartbeat(), name="lease-heartbeat"))
+        # Возобновление может упереться в backpressure — не задерживаем старт
+        self._workers.append(asyncio.create_task(self.resume(), name="resume"))
+        self._workers.append(asyncio.create_task(self._reclaim(), name="reclaim"))
+
+    async def stop(self):
+        tasks = self._workers + list(self._requeues)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers.clear()
+        await self.enricher.stop()
+        self.media.shutdown()
+        await self.yt.stop()
+
+    async def drain(self):
+        """
+        Ждёт, пока все очереди опустеют и все задачи будут обработаны.
+        Задача может вернуться в очередь уже после join (квота, ожидание того же файла),
+        поэтому проверка повторяется, пока не останется ни задач, ни возвратов в очередь.
+        """
+        queues = (self.download_queue, self.media_queue, self.upload_queue)
+        while True:
+            for queue in queues:
+                await queue.join()
+            if self._requeues:
+                await asyncio.gather(*self._requeues, return_exceptions=True)
+            elif not any(queue._unfinished_tasks for queue in queues):
+                return
+
+    async def submit(self, message: types.Message, chat_id: int, post_text: str, file_path: str,
+                     album: Album | None = None, album_index: int = 0) -> bool:
+        """
+        Ставит сообщение в очередь скачивания.
+        Ждёт, если очередь заполнена (backpressure). False — задача уже существует.
+        """
+        listener = settings.ROLE == "listener"
+        document = getattr(message.media, "document", None)
+        job = await create_job(
+            message.id, chat_id, post_text, file_path,
+            owner=None if listener else settings.WORKER_ID,
+            tg_document_id=document.id if document is not None else None,
+            tg_grouped_id=album.grouped_id if album else None,
+            album_index=album_index or None,
+            album_size=album.size if album else None,
+        )
+        if job is None:
+            DEDUP_HITS.inc(kind="job")
+            logger.info(f"Job for message {message.id} in {chat_id} already exists — skipping")
+            return False
+        if listener:
+            return True
+        self._leases.add(job.id)
+        await self._enqueue(QueuedJob(job.id, int(chat_id), message, post_text, file_path,
+                                      album=album, album_index=album_index))
+        return True
+
+    async def submit_album(self, grouped_id: int, chat_id: int, caption: str,
+                           items: list[tuple[types.Message, str]]) -> int:
+        """
+        Ставит в очередь все видео альбома с общей подписью.
+        Элементы попадают в очередь подряд и скачиваются параллельно (до DOWNLOAD_CONCURRENCY).
+        """
+        album = Album(grouped_id, int(chat_id), caption, size=len(items))
+        submitted = 0
+        for index, (message, file_path) in enumerate(items, start=1):
+            if await self.submit(message, chat_id, caption, file_path, album=album, album_index=index):
+                submitted += 1
+            else:
+                album.size -= 1
+        if submitted and album.complete:
+            await self._finish_album(album)
+        return submitted
+
+    async def _enqueue(self, job: QueuedJob):
+        # В потоковом режиме скачивание идёт внутри стадии загрузки
+        if settings.STREAM_UPLOAD:
+            await self.upload_queue.put(job)
+        else:
+            await self.download_queue.put(job)
+
+    def _requeue(self, job: QueuedJob, queue: asyncio.Queue | None = None):
+        """
+        Возвращает задачу в очередь в фоне. Воркер не ждёт места в очереди, которую
+        разбирают такие же воркеры, — иначе при полной очереди все они могут встать.
+        """
+        task = asyncio.create_task(queue.put(job) if queue is not None else self._enqueue(job))
+        self._requeues.add(task)
+        task.add_done_callback(self._requeues.discard)
+
+    async def resume(self):
+        """Возобновляет незавершённые задачи из БД после перезапуска: свои — сразу, брошенные — как свободные."""
+        try:
+            await self._claim(self._claim_limit(), reclaim_own=True)
+        except Exception as e:
+            logger.exception("Failed to claim jobs: %s", e)
+
+    async def _reclaim(self):
+        """
+        Раз в JOB_POLL_INTERVAL забирает свободные задачи: брошенные (аренда истекла,
+        в том числе под прежним WORKER_ID) и неудачные, ждущие повтора.
+        """
+        while True:
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+            limit = self._claim_limit()
+            if limit is not None and limit <= 0:
+                continue
+            try:
+                await self._claim(limit)
+            except Exception as e:
+                logger.exception("Failed to claim jobs: %s", e)
+
+    def _claim_limit(self) -> int | None:
+        """ROLE=worker держит в аренде не больше, чем успевают стадии; ROLE=all берёт все."""
+        if settings.ROLE != "worker":
+            return None
+        return settings.DOWNLOAD_CONCURRENCY + settings.UPLOAD_CONCURRENCY - len(self._leases)
+
+    async def _claim(self, limit: int | None = None, reclaim_own: bool = False):
+        jobs = await claim_jobs(settings.WORKER_ID, settings.JOB_MAX_ATTEMPTS, limit,
+                                reclaim_own=reclaim_own, exclude=set(self._leases))
+        if not jobs:
+            return
+        logger.info(f"Resuming {len(jobs)} unfinished jobs")
+        self._leases.update(job.id for job in jobs)
+        for job in jobs:
+            try:
+                message = await self.tg.client.get_messages(PeerChannel(job.tg_chat), ids=job.tg_message_id)
+            except Exception as e:
+                # Аренда истечёт, и задачу возьмёт этот или другой воркер
+                logger.error(f"Failed to fetch message {job.tg_message_id} in {job.tg_chat}: {e}")
+                self._leases.discard(job.id)
+                continue
+            if message is None or not message.media:
+                await update_job(job.id, status=JOB_FAILED, error="message not found",
+                           attempts=settings.JOB_MAX_ATTEMPTS)
+                self._leases.discard(job.id)
+                continue
+
+            queued = QueuedJob(job.id, job.tg_chat, message, job.tg_post_text or "", job.file_path,
+                               attempts=job.attempts, album_index=job.album_index or 0,
+                               album_size=job.album_size or 0)
+            queued.steps.append(f"♻️ Возобновлена задача: {queued.filename}")
+            # Файл снова нужен задаче — больше не кандидат на удаление
+            self._evictable -= self._job_paths(job.file_path)
+            prepared = job.file_path.endswith(PREPARED_SUFFIXES)
+            if os.path.exists(job.file_path) and (prepared or job.status == JOB_DOWNLOADED):
+                await self._after_download(queued)
+            else:
+                if prepared:
+                    # Подготовленного файла нет — качаем исходник заново под исходным именем
+                    queued.file_path = self._job_base(job.file_path) + ".mp4"
+                # Файл будет новым (его могли удалить при нехватке места) — старые сессии загрузки к нему не подходят
+                await delete_upload_sessions(self._session_prefix(queued))
+                await self._enqueue(queued)
+
+    async def _cleanup_disk(self):
+        """Удаляет из DOWNLOAD_DIR файлы, по которым нет незавершённой задачи."""
+        protected = set()
+        for job in await unfinished_jobs(settings.JOB_MAX_ATTEMPTS):
+            if job.file_path:
+                protected |= self._job_paths(job.file_path)
+        self._evictable = {path for path in self._evictable if os.path.exists(path)}
+        await self.disk.cleanup(protected - self._evictable, settings.DISK_ORPHAN_MAX_AGE)
+
+    async def _heartbeat(self):
+        """Продлевает аренду своих задач; задачи, которые уже забрал другой воркер, бросает."""
+        while True:
+            await asyncio.sleep(settings.JOB_HEARTBEAT_INTERVAL)
+            held = set(self._leases)
+            if not held:
+                continue
+            try:
+                kept = await renew_leases(settings.WORKER_ID, held)
+            except Exception as e:
+                logger.exception("Failed to renew job leases: %s", e)
+                continue
+            lost = (held - kept) & self._leases
+            if lost:
+                logger.warning(f"Lost leases on jobs {sorted(lost)}, dropping them")
+                self._leases -= lost
+                self._lost |= lost
+
+    async def _owns(self, job: QueuedJob) -> bool:
+        """Проверка аренды перед загрузкой на YouTube (заодно продлевает её)."""
+        if job.job_id in self._lost or not await renew_leases(settings.WORKER_ID, {job.job_id}):
+            await self._drop(job)
+            return False
+        return True
+
+    async def _drop(self, job: QueuedJob):
+        """Бросает задачу, которую ведёт другой воркер: без статуса и уведомления."""
+        logger.warning(f"Job {job.job_id} is leased by another worker, dropping it")
+        self._lost.discard(job.job_id)
+        self._leases.discard(job.job_id)
+        await self._release_disk(job)
+        await self._finish_content(job, None)
+        if job.album is not None:
+            # Иначе альбом не досчитается задачи: ни отчёта, ни плейлиста
+            job.steps.append("↪️ Задачу продолжает другой воркер")
+            await self._album_done(job)
+
+    async def _disk_janitor(self):
+        while True:
+            await asyncio.sleep(settings.DISK_CLEANUP_INTERVAL)
+            try:
+                await self._cleanup_disk()
+            except Exception as e:
+                logger.exception("Disk cleanup failed: %s", e)
+
+    @staticmethod
+    def _job_base(file_path: str) -> str:
+        for suffix in PREPARED_SUFFIXES:
+            if file_path.endswith(suffix):
+                return file_path[:-len(suffix)]
+        return os.path.splitext(file_path)[0]
+
+    @classmethod
+    def _job_paths(cls, file_path: str) -> set[str]:
+        """Исходный и подготовленные файлы одной задачи."""
+        base = cls._job_base(file_path)
+        return {base + ".mp4", *(base + suffix for suffix in PREPARED_SUFFIXES)}
+
+    async def _reserve_disk(self, job: QueuedJob):
+        """Резервирует место под файл до скачивания; ждёт, если бюджет занят."""
+        size = self._job_size(job)
+        if self.media.enabled:
+            size *= 2  # исходник и подготовленный файл какое-то время лежат вместе
+        job.disk_key = f"job:{job.job_id}"
+        paths = self._job_paths(job.file_path)
+        self._evictable -= paths
+        await self.disk.reserve(job.disk_key, size, paths)
+
+    async def _release_disk(self, job: QueuedJob):
+        if job.disk_key:
+            await self.disk.release(job.disk_key)
+            job.disk_key = None
+
+    async def _worker(self, queue: asyncio.Queue, stage):
+        name = stage.__name__.strip("_")
+        while True:
+            job = await queue.get()
+            try:
+                if job.job_id in self._lost:
+                    await self._drop(job)
+                    continue
+                with log_context(job_id=job.job_id, channel=self._channel_keys(job)[0], stage=name), \
+                        STAGE_SECONDS.time(stage=name):
+                    await stage(job)
+            except Exception as e:
+                logger.exception("%s worker error: %s", name, e)
+            finally:
+                queue.task_done()
+
+    async def _after_download(self, job: QueuedJob):
+        if self.media.enabled and not job.file_path.endswith(PREPARED_SUFFIXES):
+            await self.media_queue.put(job)
+        else:
+            await self.upload_queue.put(job)
+
+    async def _prepare(self, job: QueuedJob):
+        """Remux/перекодирование в пуле процессов; при ошибке файл уходит на YouTube как есть."""
+        await update_job(job.job_id, stage="media")
+        try:
+            prepared, action = await self.media.prepare(job.file_path, job.content_hash)
+        except Exception as e:
+            logger.warning(f"Media stage failed for {job.file_path}: {e}")
+            job.steps.append(f"⚠️ Не удалось подготовить файл, загружаю как есть: {e}")
+            await self.upload_queue.put(job)
+            return
+
+        if prepared != job.file_path:
+            try:
+                os.remove(job.file_path)
+            except OSError:
+                pass
+            job.file_path = prepared
+            await update_job(job.job_id, file_path=prepared)
+            job.steps.append(f"🎞 Подготовлено ({action}): {job.filename}")
+        await self.upload_queue.put(job)
+
+    async def _download(self, job: QueuedJob):
+        if not job.steps:
+            job.steps.append(f"✉️ Найдено новое видео: {job.filename}")
+        if not job.owns_content and not await self._claim_content(job):
+            return
+        if job.disk_key is None:
+            await self._reserve_disk(job)
+        await update_job(job.job_id, stage="download")
+        started = time.monotonic()
+        try:
+            job.content_hash = await self.tg.download(job.message, job.file_path)
+            job.steps.append(f"⬇️ Скачано: {job.file_path}")
+        except Exception as e:
+            job.steps.append(f"❌ Ошибка при скачивании: {e}")
+            logger.exception("Download failed: %s", e)
+            await self._fail(job, e)
+            await self._finish_content(job, None)
+            await self._report(job)
+            return
+
+        doc = job.document
+        if doc is not None:
+            await save_content(doc.id, doc.access_hash, job.content_hash)
+        # Запасной ключ: те же байты под другим document.id (перезалив, а не пересылка)
+        if job.content_hash:
+            duplicate = await find_content(sha256=job.content_hash)
+            if await self._link_duplicate(job, duplicate):
+                await self._finish_content(job, duplicate.yt_video_id)
+                return
+
+        await update_job(job.job_id, status=JOB_DOWNLOADED, downloaded_at=datetime.datetime.utcnow(),
+                         download_seconds=round(time.monotonic() - started, 3))
+        await self._after_download(job)
+
+    async def _upload(self, job: QueuedJob):
+        if not job.owns_content and not await self._claim_content(job):
+            return
+
+        title, description, tags = self.enricher.metadata(job, self._channel_keys(job))
+
+        # Аренду могли забрать, пока задача ждала в очереди
+        if not await self._owns(job):
+            return
+        # Ждёт, если у всех подходящих аккаунтов исчерпана дневная квота
+        uploader = await self.yt.acquire(*self._channel_keys(job), session_prefix=self._session_prefix(job))
+        await update_job(job.job_id, stage="upload")
+        started = time.monotonic()
+        yt_id = None
+        try:
+            job.steps.append(f"🔼 Начинаю загрузку на YouTube ({uploader.name}): {job.filename}")
+            if settings.STREAM_UPLOAD and not os.path.exists(job.file_path):
+                yt_id = await self._upload_stream(uploader, job, title, description, tags)
+            else:
+                # Resumable-сессия привязана к аккаунту, поэтому он входит в ключ
+                yt_id = await uploader.upload_async(job.file_path, title, description, tags=tags,
+                                                    session_key=self._session_prefix(job) + uploader.name)
+        except QuotaExceededError:
+            logger.warning(f"Quota exceeded for account {uploader.name}, job {job.job_id} goes back to queue")
+            await self.yt.mark_exhausted(uploader)
+            job.steps.pop()
+            self._requeue(job, self.upload_queue)
+            return
+        except Exception as e:
+            job.steps.append(f"❌ Ошибка загрузки на YouTube: {e}")
+            logger.exception("Upload error: %s", e)
+            await self._fail(job, e)
+            await self._finish_content(job, None)
+            await self._report(job)
+            return
+
+        if yt_id:
+            job.yt_id, job.account = yt_id, uploader.name
+            job.steps.append(f"✅ Загружено на YouTube\n📺 ID: {yt_id}\n🔗 https://youtu.be/{yt_id}")
+            await record_upload(job.message.id, job.chat_id, job.post_text, job.file_path, yt_video_id=yt_id)
+            await update_job(job.job_id, status=JOB_DONE, yt_video_id=yt_id, error=None,
+                             finished_at=datetime.datetime.utcnow(),
+                             upload_seconds=round(time.monotonic() - started, 3))
+            # Превью ставится в фоне; если нужен кадр из файла, файл и его резерв места
+            # освободит стадия обогащения
+            if self.enricher.submit(yt_id, uploader, job.message, job.file_path, job.disk_key):
+                job.disk_key = None
+            else:
+                self._remove_local(job)
+            if job.message.date:
+                END_TO_END_SECONDS.observe(time.time() - job.message.date.timestamp())
+            JOBS.inc(outcome="uploaded")
+        else:
+            # YouTube отказался принимать файл — повторять бессмысленно
+            job.steps.append("⚠️ Загрузка пропущена (YouTube вернул None)")
+            await update_job(job.job_id, status=JOB_FAILED, error="skipped by uploader",
+                       attempts=settings.JOB_MAX_ATTEMPTS)
+            JOBS.inc(outcome="skipped")
+
+        # Сессии, брошенные на других аккаунтах (квота, смена аккаунта), больше не понадобятся
+        await delete_upload_sessions(self._session_prefix(job))
+        await self._finish_content(job, yt_id)
+        await self._report(job)
+
+    async def _claim_content(self, job: QueuedJob) -> bool:
+        """
+        Проверка по document.id до скачивания.
+        False — задача закрыта как дубликат или отложена до завершения такой же задачи.
+        """
+        doc = job.document
+        if doc is None:
+            return True
+        if await self._link_duplicate(job, await find_content(document_id=doc.id)):
+            return False
+        if doc.id in self._inflight:
+            job.steps.append("⏳ Этот файл уже обрабатывается другой задачей — жду результат")
+            self._waiting.setdefault(doc.id, []).append(job)
+            return False
+        self._inflight.add(doc.id)
+        job.owns_content = True
+        return True
+
+    async def _finish_content(self, job: QueuedJob, yt_id: str | None):
+        """Запоминает загруженное содержимое и разбирает задачи, ждавшие тот же файл."""
+        doc = job.document
+        if yt_id and (doc is not None or job.content_hash):
+            await save_content(doc.id if doc else None, doc.access_hash if doc else None, job.content_hash, yt_id)
+        if not job.owns_content:
+            return
+        job.owns_content = False
+        self._inflight.discard(doc.id)
+        for waiter in self._waiting.pop(doc.id, []):
+            if yt_id:
+                await self._link_duplicate(waiter, await find_content(document_id=doc.id))
+            else:
+                # Первая задача не справилась — следующая пробует сама
+                self._requeue(waiter)
+
+    async def _link_duplicate(self, job: QueuedJob, content) -> bool:
+        """Привязывает сообщение к уже загруженному видео без скачивания и загрузки."""
+        if content is None or not content.yt_video_id:
+            return False
+        yt_id = content.yt_video_id
+        DEDUP_HITS.inc(kind="content")
+        await record_upload(job.message.id, job.chat_id, job.post_text, job.file_path, yt_video_id=yt_id)
+        await update_job(job.job_id, status=JOB_DONE, yt_video_id=yt_id, error=None,
+                         finished_at=datetime.datetime.utcnow())
+        await delete_upload_sessions(self._session_prefix(job))
+        self._remove_local(job)
+        job.yt_id = yt_id
+        job.steps.append(f"♻️ Это видео уже загружено на YouTube\n🔗 https://youtu.be/{yt_id}")
+        logger.info(f"Message {job.message.id} in {job.chat_id} is a duplicate of {yt_id}")
+        await self._report(job)
+        return True
+
+    async def _report(self, job: QueuedJob):
+        """Итоговое уведомление по задаче; задачи альбома отчитываются одним сообщением."""
+        # Задача завершена: оставшийся файл (если загрузка не удалась) учитывается как обычный файл на диске
+        await self._release_disk(job)
+        if job.yt_id is None:
+            # Повтор задачи продолжит с этого файла, но держать его ради повтора ценой бюджета не стоит:
+            # cleanup удалит его, как и прочие файлы без задачи, и повтор скачает заново
+            self._evictable |= self._job_paths(job.file_path)
+        # Аренда больше не продлевается; неудачную задачу повторят после её истечения
+        self._leases.discard(job.job_id)
+        if job.album is None:
+            await self.notifier.send_message("\n".join(job.steps))
+            return
+        await self._album_done(job)
+
+    async def _album_done(self, job: QueuedJob):
+        album = job.album
+        album.jobs.append(job)
+        if album.complete:
+            await self._finish_album(album)
+
+    async def _finish_album(self, album: Album):
+        album.reported = True
+        title = (album.caption.split("\n")[0] if album.caption else f"альбом {album.grouped_id}")[:70]
+        steps = [f"🖼 Альбом «{title}»: {album.size} видео"]
+        for job in sorted(album.jobs, key=lambda j: j.album_index):
+            if job.yt_id:
+                steps.append(f"{job.album_index}. ✅ https://youtu.be/{job.yt_id}")
+            else:
+                steps.append(f"{job.album_index}. {job.steps[-1] if job.steps else '❌'}")
+
+        if settings.YOUTUBE_ALBUM_PLAYLIST:
+            try:
+                steps.extend(await self._add_album_to_playlists(album, title))
+            except Exception as e:
+                logger.exception("Failed to add album %s to playlist: %s", album.grouped_id, e)
+                steps.append(f"⚠️ Не удалось добавить в плейлист: {e}")
+
+        await self.notifier.send_message("\n".join(steps))
+        # Отчёт отправлен: задачи альбома больше не держат друг друга через album.jobs
+        for job in album.jobs:
+            job.album = None
+        album.jobs.clear()
+
+    async def _add_album_to_playlists(self, album: Album, title: str) -> list[str]:
+        """
+        YOUTUBE_ALBUM_PLAYLIST=new — отдельный плейлист на альбом, иначе это id плейлиста.
+        Плейлист принадлежит аккаунту, поэтому видео группируются по аккаунтам.
+        """
+        by_account: dict[str, list[QueuedJob]] = {}
+        for job in sorted(album.jobs, key=lambda j: j.album_index):
+            if job.yt_id and job.account:
+                by_account.setdefault(job.account, []).append(job)
+
+        steps = []
+        for account, jobs in by_account.items():
+            uploader = self.yt.uploaders[account]
+            playlist_id = settings.YOUTUBE_ALBUM_PLAYLIST
+            if playlist_id == "new":
+                playlist_id = await uploader.create_playlist(title)
+            for job in jobs:
+                await uploader.add_to_playlist(playlist_id, job.yt_id)
+            steps.append(f"📃 Плейлист: https://www.youtube.com/playlist?list={playlist_id}")
+        return steps
+
+    def _remove_local(self, job: QueuedJob):
+        if os.path.exists(job.file_path):
+            try:
+                os.remove(job.file_path)
+                job.steps.append(f"🗑️ Удалено локально: {job.filename}")
+            except Exception as e:
+                job.steps.append(f"⚠️ Не удалось удалить файл: {e}")
+
+    def _channel_keys(self, job: QueuedJob) -> list:
+        """Ключи для закрепления канала за аккаунтом YouTube: имя из TG_CHANNELS и id."""
+        name = self.tg.channel_names.get(job.chat_id)
+        return [name, job.chat_id] if name else [job.chat_id]
+
+    def _channel_setting(self, job: QueuedJob, values: dict, default):
+        for key in self._channel_keys(job):
+            if str(key) in values:
+                return values[str(key)]
+        return default
+
+    @staticmethod
+    def _channel_of(job: QueuedJob) -> int:
+        return job.chat_id
+
+    def _channel_priority(self, job: QueuedJob) -> float:
+        return self._channel_setting(job, settings.UPLOAD_CHANNEL_PRIORITY, 1.0)
+
+    def _channel_limit(self, job: QueuedJob) -> int:
+        return self._channel_setting(job, settings.UPLOAD_CHANNEL_MAX, 0)
+
+    @staticmethod
+    def _session_prefix(job: QueuedJob) -> str:
+        """Общее начало ключей resumable-сессий задачи на всех аккаунтах."""
+        return f"job:{job.job_id}:"
+
+    @staticmethod
+    def _job_size(job: QueuedJob) -> int:
+        return getattr(job.document, "size", None) or getattr(job.message.file, "size", None) or 0
+
+    async def _upload_stream(self, uploader, job: QueuedJob, title: str, description: str, tags: list[str]):
+        """Скачивание и загрузка одновременно, через ограниченный буфер в памяти."""
+        file = job.message.file
+        chunk_size = settings.STREAM_CHUNK_SIZE
+        buffer = StreamBuffer(max(settings.STREAM_BUFFER_SIZE, 2 * chunk_size), asyncio.get_running_loop())
+        media = TelegramStreamUpload(
+            buffer, job.file_path,
+            size=getattr(file, "size", None),
+            mimetype=getattr(file, "mime_type", None) or "video/mp4",
+            chunksize=chunk_size,
+        )
+        job.steps.append("🔀 Потоковая загрузка: Telegram -> YouTube")
+        producer = asyncio.create_task(self.tg.stream(job.message, buffer))
+        try:
+            yt_id = await uploader.upload_stream_async(media, title, description, tags=tags)
+        except BaseException as e:
+            buffer.abort(e)
+            raise
+        finally:
+            if not producer.done():
+                buffer.abort(asyncio.CancelledError())
+            await asyncio.gather(producer, return_exceptions=True)
+        if yt_id and not producer.cancelled() and producer.exception() is None:
+            job.content_hash = producer.result()
+        return yt_id
+
+    async def _fail(self, job: QueuedJob, error: Exception):
+        job.attempts += 1
+        JOBS.inc(outcome="failed")
+        await update_job(job.job_id, status=JOB_FAILED, error=str(error), attempts=job.attempts)
+        if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            # Повторов не будет — сохранённые сессии загрузки не нужны
+            await delete_upload_sessions(self._session_prefix(job))
@@ -0,0 +1,124 @@
+import asyncio
+import heapq
+import itertools
+from dataclasses import dataclass, field
+from typing import Callable, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+# Минимальная «стоимость» задачи: мелкие файлы не должны проходить бесплатно
+MIN_COST = 1024 * 1024
+
+
+@dataclass
+class _Channel:
+    weight: float = 1.0
+    limit: int = 0         # параллельных задач канала, 0 — без ограничения
+    vtime: float = 0.0     # виртуальное время канала: сколько он уже «получил» с учётом веса
+    running: int = 0
+    items: list = field(default_factory=list)  # куча (порядок, размер, задача)
+
+
+class FairQueue(Generic[T]):
+    """
+    Ограниченная очередь со взвешенным справедливым выбором между каналами.
+    Каждая выданная задача сдвигает виртуальное время своего канала на
+    размер / вес; get() отдаёт задачу канала с наименьшим виртуальным временем
+    среди тех, кто не упёрся в свой лимит параллельных задач. Канал, который
+    долго молчал, не копит «кредит»: его время подтягивается к текущему.
+    Внутри канала — по порядку поступления или, с smallest_first, от меньших файлов к большим.
+
+    Интерфейс как у asyncio.Queue: put/get/task_done/join/qsize.
+    task_done() нужно вызывать из той же задачи, что делала get().
+    """
+
+    def __init__(self, maxsize: int, channel: Callable[[T], Hashable], size: Callable[[T], int],
+                 weight: Callable[[T], float] | None = None, limit: Callable[[T], int] | None = None,
+                 smallest_first: bool = False):
+        self.maxsize = maxsize
+        self._channel_of = channel
+        self._size_of = size
+        self._weight_of = weight
+        self._limit_of = limit
+        self.smallest_first = smallest_first
+        self._channels: dict[Hashable, _Channel] = {}
+        self._count = 0
+        self._unfinished = 0
+        self._vtime = 0.0
+        self._seq = itertools.count()
+        self._running: dict[asyncio.Task, Hashable] = {}
+        self._changed = asyncio.Event()  # появилась задача или освободился слот канала
+        self._space = asyncio.Event()    # освободилось место в очереди
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def qsize(self) -> int:
+        return self._count
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= self._count
+
+    def empty(self) -> bool:
+        return self._count == 0
+
+    async def put(self, item: T):
+        while self.full():
+            self._space.clear()
+            await self._space.wait()
+
+        key = self._channel_of(item)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = _Channel()
+        if self._weight_of is not None:
+            channel.weight = max(float(self._weight_of(item)), 0.01)
+        if self._limit_of is not None:
+            channel.limit = int(self._limit_of(item))
+        if not channel.items and not channel.running:
+            channel.vtime = max(channel.vtime, self._vtime)
+
+        size = max(int(self._size_of(item) or 0), 0)
+        order = (size if self.smallest_first else 0, next(self._seq))
+        heapq.heappush(channel.items, (order, size, item))
+        self._count += 1
+        self._unfinished += 1
+        self._finished.clear()
+        self._changed.set()
+
+    def _pick(self) -> Hashable | None:
+        best = None
+        for key, channel in self._channels.items():
+            if not channel.items or (channel.limit and channel.running >= channel.limit):
+                continue
+            if best is None or channel.vtime < self._channels[best].vtime:
+                best = key
+        return best
+
+    async def get(self) -> T:
+        while (key := self._pick()) is None:
+            self._changed.clear()
+            await self._changed.wait()
+
+        channel = self._channels[key]
+        _, size, item = heapq.heappop(channel.items)
+        self._vtime = channel.vtime
+        channel.vtime += max(size, MIN_COST) / channel.weight
+        channel.running += 1
+        self._count -= 1
+        self._running[asyncio.current_task()] = key
+        self._space.set()
+        return item
+
+    def task_done(self):
+        key = self._running.pop(asyncio.current_task(), None)
+        if key is not None:
+            self._channels[key].running -= 1
+            self._changed.set()
+        if self._unfinished <= 0:
+            raise ValueError("task_done() called too many times")
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
@@ -1,11 +1,23 @@
 import os
-from telethon import TelegramClient, events, types
-from telethon.tl.types import DocumentAttributeVideo
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+import asyncio
+from telethon import TelegramClient, events, types, functions, errors
+from telethon.network import MTProtoSender
+from telethon.tl.alltlobjects import LAYER
+from telethon.tl.types import DocumentAttributeVideo, InputDocumentFileLocation
 from config import settings
-from logger_setup import logger
-from db import already_uploaded, record_upload, SessionLocal, UploadedVideo
-from youtube_client import YouTubeUploader
-from telegram_notify import TelegramNotifier
+from logger_setup import get_logger
+from db import already_uploaded, get_channel_state, save_channel_state
+from youtube_client import YouTubeUploaderPool, StreamBuffer
+from telegram_notify import notifier
+from pipeline import Pipeline
+from album import AlbumAggregator
+from metrics import DOWNLOAD_BYTES, DOWNLOAD_SPEED, DEDUP_HITS
+
+logger = get_logger("telegram_client")
 
 
 def ensure_dirs():
@@ -13,19 +25,204 @@ def ensure_dirs():
     os.makedirs(settings.DOWNLOAD_DIR, exist_ok=True)
 
 
-ensure_dirs()
+def message_chat_id(message: types.Message):
+    return getattr(message.peer_id, "channel_id", str(settings.TG_CHANNELS[0]))
+
+
+def video_filename(message: types.Message) -> str | None:
+    """Имя локального файла для видео-сообщения; None — если в сообщении не видео."""
+    if not message.media:
+        return None
+
+    # ID сообщений уникальны только внутри канала — в имени нужен и канал
+    filename = f"tg_{message_chat_id(message)}_{message.id}.mp4"
+
+    # 1️⃣ Обычное видео
+    if getattr(message, "video", None):
+        return filename
+
+    # 2️⃣ Документ с атрибутом видео
+    doc = getattr(message.media, "document", None)
+    if doc is not None:
+        for attr in getattr(doc, "attributes", []):
+            if isinstance(attr, DocumentAttributeVideo):
+                return filename
+    return None
+
+
+class ParallelDownloader:
+    """
+    Скачивает документ частями одновременно по нескольким соединениям
+    с DC файла и пишет их в заранее выделенный файл через pwrite.
+    """
+
+    # Ограничения upload.getFile: limit делит 1 MiB и кратен 4 KiB
+    MAX_PART_SIZE = 1024 * 1024
+    MIN_PART_SIZE = 4 * 1024
+    PART_RETRIES = 3
+    # Насколько частей на соединение можно убежать вперёд от хешированного префикса
+    LOOKAHEAD_PER_CONNECTION = 4
+
+    def __init__(self, client: TelegramClient, connections: int, part_size: int):
+        self.client = client
+        self.connections = max(1, connections)
+        self.part_size = self._valid_part_size(part_size)
+        self._auth_keys = {}  # dc_id -> AuthKey, чтобы экспортировать авторизацию один раз
+        self._auth_lock = asyncio.Lock()
+
+    @classmethod
+    def _valid_part_size(cls, part_size: int) -> int:
+        size = cls.MIN_PART_SIZE
+        while size * 2 <= min(part_size, cls.MAX_PART_SIZE):
+            size *= 2
+        return size
+
+    async def download(self, document: types.Document, out_path: str, progress_callback=None) -> str:
+        """Возвращает sha256 содержимого, посчитанный по ходу скачивания."""
+        location = InputDocumentFileLocation(
+            id=document.id,
+            access_hash=document.access_hash,
+            file_reference=document.file_reference,
+            thumb_size="",
+        )
+        size = document.size
+        offsets = asyncio.Queue()
+        for offset in range(0, size, self.part_size):
+            offsets.put_nowait(offset)
+
+        senders = await asyncio.gather(*(
+            self._create_sender(document.dc_id)
+            for _ in range(min(self.connections, offsets.qsize()))
+        ))
+        loop = asyncio.get_running_loop()
+        fd = os.open(out_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        downloaded = 0
+        # Части приходят вразнобой: хешируем непрерывный префикс, остальное ждёт в pending.
+        # Окно ограничено: если часть застряла (FloodWait, повторы), остальные соединения
+        # ждут её, а не тянут в память весь остаток файла
+        digest = hashlib.sha256()
+        hashed_to = 0
+        pending = {}
+        window = self.part_size * self.connections * self.LOOKAHEAD_PER_CONNECTION
+        advanced = asyncio.Condition()
+
+        async def worker(sender: MTProtoSender):
+            nonlocal downloaded, hashed_to
+            while True:
+                try:
+                    offset = offsets.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                # Части берутся по порядку, так что самая ранняя недокачанная всегда в окне
+                async with advanced:
+                    await advanced.wait_for(lambda: offset - hashed_to < window)
+                data = await self._fetch_part(sender, location, offset)
+                await loop.run_in_executor(None, os.pwrite, fd, data, offset)
+                downloaded += len(data)
+                pending[offset] = data
+                if hashed_to in pending:
+                    while hashed_to in pending:
+                        part = pending.pop(hashed_to)
+                        digest.update(part)
+                        hashed_to += len(part)
+                    async with advanced:
+                        advanced.notify_all()
+                if progress_callback:
+                    progress_callback(downloaded, size)
+
+        tasks = []
+        try:
+            os.ftruncate(fd, size)
+            tasks = [asyncio.create_task(worker(sender)) for sender in senders]
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            os.close(fd)
+            await asyncio.gather(*(sender.disconnect() for sender in senders), return_exceptions=True)
+        return digest.hexdigest()
+
+    async def _fetch_part(self, sender: MTProtoSender, location, offset: int) -> bytes:
+        for attempt in range(1, self.PART_RETRIES + 1):
+            try:
+                result = await sender.send(functions.upload.GetFileRequest(
+                    location, offset=offset, limit=self.part_size, precise=False, cdn_supported=False,
+                ))
+                return result.bytes
+            except errors.FloodWaitError as e:
+                logger.warning(f"Flood wait {e.seconds}s on part {offset}")
+                await asyncio.sleep(e.seconds)
+            except (ConnectionError, asyncio.TimeoutError):
+                if attempt == self.PART_RETRIES:
+                    raise
+                await asyncio.sleep(attempt)
+        raise ConnectionError(f"Failed to fetch part at offset {offset}")
+
+    async def _create_sender(self, dc_id: int) -> MTProtoSender:
+        """Отдельное MTProto-соединение с DC (у каждого свой seqno)."""
+        session = self.client.session
+        if dc_id == session.dc_id:
+            auth_key = session.auth_key
+        else:
+            auth_key = self._auth_keys.get(dc_id)
+
+        dc = await self.client._get_dc(dc_id)
+        sender = MTProtoSender(auth_key, loggers=self.client._log)
+        await sender.connect(self.client._connection(
+            dc.ip_address, dc.port, dc.id,
+            loggers=self.client._log,
+            proxy=self.client._proxy,
+            local_addr=self.client._local_addr,
+        ))
+
+        init = copy.copy(self.client._init_request)
+        if auth_key is None:
+            async with self._auth_lock:
+                auth = await self.client(functions.auth.ExportAuthorizationRequest(dc_id))
+                init.query = functions.auth.ImportAuthorizationRequest(id=auth.id, bytes=auth.bytes)
+                await sender.send(functions.InvokeWithLayerRequest(LAYER, init))
+                self._auth_keys[dc_id] = sender.auth_key
+        else:
+            init.query = functions.help.GetConfigRequest()
+            await sender.send(functions.InvokeWithLayerRequest(LAYER, init))
+        return sender
 
 
 class TGClient:
-    def __init__(self):
+    RECENT_IDS = 5000
+    # Сколько раз догонка заново берёт сообщение, обработка которого упала
+    MESSAGE_ATTEMPTS = 3
+    WATCH_INTERVAL = 5
+
+    def __init__(self, yt: YouTubeUploaderPool = None):
+        ensure_dirs()
         self.client = TelegramClient(
             settings.TELEGRAM_SESSION,
             settings.TELEGRAM_API_ID,
             settings.TELEGRAM_API_HASH
         )
         self.channel_entities = []
-        self.yt = YouTubeUploader()
-        self.notifier = TelegramNotifier()
+        self.channel_names: dict[int, str] = {}  # entity.id -> канал, как он указан в TG_CHANNELS
+        self.yt = yt or YouTubeUploaderPool()
+        self.notifier = notifier
+        self.pipeline = Pipeline(self, self.yt, self.notifier)
+        self.downloader = ParallelDownloader(
+            self.client, settings.TG_DOWNLOAD_CONNECTIONS, settings.TG_DOWNLOAD_PART_SIZE
+        )
+        self.download_progress = {}  # out_path -> (скачано, всего)
+        # Последнее обработанное сообщение по каналам и недавно виденные id:
+        # догонка после обрыва пересекается с живыми событиями, дубли отсекаем здесь
+        self._last_ids: dict[int, int] = {}
+        self._saved_ids: dict[int, int] = {}
+        self._recent: dict[int, OrderedDict] = {}
+        # Сообщения, обработка которых упала: id -> попыток; водяной знак держится ниже них
+        self._failed: dict[int, dict[int, int]] = {}
+        self._catch_up_lock = asyncio.Lock()
+        self.albums = AlbumAggregator(settings.ALBUM_WINDOW, self.on_album)
+        self._stopping = False
+        # ROLE=worker не слушает каналы: клиент нужен только для скачивания
+        self.listening = settings.ROLE != "worker"
 
     async def start(self):
         await self.client.start()
@@ -40,97 +237,235 @@ class TGClient:
             try:
                 entity = await self.client.get_entity(channel)
                 self.channel_entities.append(entity)
+                self.channel_names[entity.id] = channel
                 logger.info(f"✅ Listening to channel: {getattr(entity, 'title', channel)}")
                 await self.notifier.send_message(f"✅ Listening to channel: {getattr(entity, 'title', channel)}")
             except Exception as e:
                 logger.error(f"❌ Failed to load channel {channel}: {e}")
 
+        if not self.listening:
+            return
+
+        for entity in self.channel_entities:
+            state = await get_channel_state(entity.id)
+            if state and state.last_message_id:
+                self._last_ids[entity.id] = self._saved_ids[entity.id] = state.last_message_id
+
         @self.client.on(events.NewMessage(chats=self.channel_entities))
         async def handler(event: events.NewMessage.Event):
-            try:
-                await self._on_message(event.message)
-            except Exception as e:
-                logger.exception("Error handling message: %s", e)
-                await self.notifier.send_message(f"❌ Ошибка обработки сообщения: {e}")
+            await self._handle(event.message)
+
+    async def _handle(self, message: types.Message):
+        """Общий вход для живых событий и догонки: отсекает уже виденные сообщения."""
+        chat_id = message_chat_id(message)
+        if not self._mark_seen(chat_id, message.id):
+            return
+        try:
+            await self._on_message(message)
+        except Exception as e:
+            logger.exception("Error handling message: %s", e)
+            await self.notifier.send_message(f"❌ Ошибка обработки сообщения: {e}")
+            self._retry_later(chat_id, message.id)
+            return
+        self._advance(chat_id, message.id)
+
+    def _advance(self, chat_id, message_id: int):
+        """Сдвигает водяной знак канала, но не дальше первого сообщения, которое ещё надо повторить."""
+        if not isinstance(chat_id, int):
+            return
+        failed = self._failed.get(chat_id)
+        if failed:
+            failed.pop(message_id, None)
+        last = max(self._last_ids.get(chat_id, 0), message_id)
+        if failed:
+            last = min(last, min(failed) - 1)
+        self._last_ids[chat_id] = last
+
+    def _retry_later(self, chat_id, message_id: int):
+        """Снимает отметку «видели» и опускает водяной знак: следующая догонка запросит сообщение снова."""
+        self._recent.get(chat_id, {}).pop(message_id, None)
+        if not isinstance(chat_id, int):
+            return
+        failed = self._failed.setdefault(chat_id, {})
+        failed[message_id] = failed.get(message_id, 0) + 1
+        if failed[message_id] >= self.MESSAGE_ATTEMPTS:
+            logger.error(f"Message {message_id} in {chat_id} failed {failed.pop(message_id)} times, giving up")
+            return
+        self._last_ids[chat_id] = min(self._last_ids.get(chat_id, message_id), message_id - 1)
+
+    def _mark_seen(self, chat_id, message_id: int) -> bool:
+        recent = self._recent.setdefault(chat_id, OrderedDict())
+        if message_id in recent:
+            return False
+        recent[message_id] = None
+        while len(recent) > self.RECENT_IDS:
+            recent.popitem(last=False)
+        return True
+
+    async def catch_up(self):
+        """
+        Догоняет сообщения, пропущенные за время обрыва связи или простоя:
+        по каждому каналу запрашивает только историю после последнего обработанного id.
+        """
+        async with self._catch_up_lock:
+            for entity in self.channel_entities:
+                last_id = self._last_ids.get(entity.id)
+                try:
+                    if last_id is None:
+                        # Первый запуск: история — дело backfill, запоминаем только текущую точку
+                        latest = await self.client.get_messages(entity, limit=1)
+                        self._last_ids[entity.id] = latest[0].id if latest else 0
+                        continue
+                    count = 0
+                    async for message in self.client.iter_messages(entity, min_id=last_id, reverse=True):
+                        await self._handle(message)
+                        count += 1
+                    if count:
+                        logger.info(f"Caught up {count} messages in {getattr(entity, 'title', entity.id)}")
+                except Exception as e:
+                    logger.error(f"Catch-up failed for {getattr(entity, 'title', entity.id)}: {e}")
+            await self._save_last_ids()
+
+    async def _save_last_ids(self):
+        for chat_id, last_id in self._last_ids.items():
+            if self._saved_ids.get(chat_id) != last_id:
+                await save_channel_state(chat_id, last_message_id=last_id)
+                self._saved_ids[chat_id] = last_id
+
+    async def _watch_connection(self):
+        """Сохраняет прогресс и запускает догонку после переподключения и периодически."""
+        was_connected = self.client.is_connected()
+        since_catch_up = 0.0
+        while True:
+            await asyncio.sleep(self.WATCH_INTERVAL)
+            since_catch_up += self.WATCH_INTERVAL
+            connected = self.client.is_connected()
+            reconnected = connected and not was_connected
+            was_connected = connected
+            periodic = settings.CATCH_UP_INTERVAL and since_catch_up >= settings.CATCH_UP_INTERVAL
+            if connected and (reconnected or periodic):
+                since_catch_up = 0.0
+                await self.catch_up()
+            else:
+                await self._save_last_ids()
 
     async def _on_message(self, message: types.Message):
         """Обрабатывает ТОЛЬКО видео из Telegram."""
         if not message.media:
             return
 
-        chat_id = getattr(message.peer_id, "channel_id", str(settings.TG_CHANNELS[0]))
-        if already_uploaded(message.id, chat_id):
+        chat_id = message_chat_id(message)
+        if await already_uploaded(message.id, chat_id):
+            DEDUP_HITS.inc(kind="message")
             logger.info(f"Message {message.id} in {chat_id} already processed — skipping")
             return
 
-        # --- Определяем, видео ли это ---
-        is_video = False
-        filename = None
-
-        # 1️⃣ Обычное видео
-        if getattr(message, "video", None):
-            is_video = True
-            filename = f"tg_{message.id}.mp4"
-
-        # 2️⃣ Документ с атрибутом видео
-        elif getattr(message.media, "document", None):
-            doc = message.media.document
-            for attr in getattr(doc, "attributes", []):
-                if isinstance(attr, DocumentAttributeVideo):
-                    is_video = True
-                    filename = f"tg_{message.id}.mp4"
-                    break
+        # Элемент альбома: ждём остальные, подпись может быть у любого из них
+        if message.grouped_id:
+            self.albums.add(message)
+            return
 
+        filename = video_filename(message)
         # Если не видео — выходим
-        if not is_video:
+        if filename is None:
             logger.info(f"Message {message.id} ignored (not a video)")
             return
 
         post_text = message.message or message.text or ""
         out_path = os.path.join(settings.DOWNLOAD_DIR, filename)
 
-        steps = [f"✉️ Найдено новое видео: {filename}"]
+        # Скачивание и загрузка идут в конвейере, обработчик события не ждёт их
+        await self.pipeline.submit(message, chat_id, post_text, out_path)
 
-        # --- Скачиваем ---
-        try:
-            await self.client.download_media(message.media, file=out_path)
-            steps.append(f"⬇️ Скачано: {out_path}")
-        except Exception as e:
-            steps.append(f"❌ Ошибка при скачивании: {e}")
-            logger.exception("Download failed: %s", e)
-            await self.notifier.send_message("\n".join(steps))
-            return
+    async def on_album(self, messages: list[types.Message]) -> int:
+        """Альбом целиком: все видео с общей подписью, одна группа в конвейере. Возвращает число задач."""
+        chat_id = message_chat_id(messages[0])
+        caption = next((m.message for m in messages if m.message), "")
+        items = []
+        for message in messages:
+            filename = video_filename(message)
+            if filename is not None:
+                items.append((message, os.path.join(settings.DOWNLOAD_DIR, filename)))
+        if not items:
+            logger.info(f"Album {messages[0].grouped_id} ignored (no videos)")
+            return 0
+        return await self.pipeline.submit_album(messages[0].grouped_id, chat_id, caption, items)
 
-        # --- Загружаем на YouTube ---
-        yt_id = None
-        hashtags = "#paintedclothes #bodypaint #bikini #blonde"
-        base_title = (post_text.split("\n")[0] if post_text else filename)[:70]
-        title = f"{base_title} {hashtags}"
-        description = f"{post_text}\n\n{hashtags}" if post_text else hashtags
+    async def download(self, message: types.Message, out_path: str) -> str | None:
+        """Скачивает медиа в out_path. Возвращает sha256 содержимого (None, если не документ)."""
+        def progress(current, total):
+            self.download_progress[out_path] = (current, total)
 
+        document = getattr(message.media, "document", None)
+        started = time.monotonic()
         try:
-            steps.append(f"🔼 Начинаю загрузку на YouTube: {filename} {hashtags}")
-            vid = await self.yt.upload_async(out_path, title, description)
-            if vid:
-                yt_id = vid
-                steps.append(f"✅ Загружено на YouTube\n📺 ID: {yt_id}\n🔗 https://youtu.be/{yt_id}")
-            else:
-                steps.append("⚠️ Загрузка пропущена (YouTube вернул None)")
-        except Exception as e:
-            steps.append(f"❌ Ошибка загрузки на YouTube: {e}")
-            logger.exception("Upload error: %s", e)
+            if document is None:
+                await self.client.download_media(message.media, file=out_path, progress_callback=progress)
+                return None
+            if document.size >= settings.TG_PARALLEL_MIN_SIZE:
+                try:
+                    return await self.downloader.download(document, out_path, progress)
+                except errors.RPCError as e:
+                    # CDN-редирект, устаревший file_reference и т.п. — обычный путь справится
+                    logger.warning(f"Parallel download failed ({e}), falling back to sequential download")
+            return await self._download_sequential(document, out_path, progress)
+        finally:
+            done, _ = self.download_progress.pop(out_path, (0, None))
+            if done:
+                DOWNLOAD_BYTES.inc(done)
+                DOWNLOAD_SPEED.observe(done / max(time.monotonic() - started, 1e-6))
 
-        # --- Удаляем после загрузки ---
-        if yt_id:
-            try:
-                os.remove(out_path)
-                steps.append(f"🗑️ Удалено локально: {filename}")
-            except Exception as e:
-                steps.append(f"⚠️ Не удалось удалить файл: {e}")
+    async def download_thumbnail(self, message: types.Message, thumb) -> bytes | None:
+        """Превью документа (thumb — один из document.thumbs) в память."""
+        return await self.client.download_media(message, file=bytes, thumb=thumb)
+
+    async def _download_sequential(self, document: types.Document, out_path: str, progress) -> str:
+        digest = hashlib.sha256()
+        done = 0
+        with open(out_path, "wb") as f:
+            async for chunk in self.client.iter_download(document):
+                f.write(chunk)
+                digest.update(chunk)
+                done += len(chunk)
+                progress(done, document.size)
+        return digest.hexdigest()
 
-        await self.notifier.send_message("\n".join(steps))
+    async def stream(self, message: types.Message, buffer: StreamBuffer) -> str:
+        """Скачивает медиа по частям прямо в буфер потоковой загрузки. Возвращает sha256."""
+        digest = hashlib.sha256()
+        try:
+            async for chunk in self.client.iter_download(message.media):
+                digest.update(chunk)
+                DOWNLOAD_BYTES.inc(len(chunk))
+                await buffer.write(chunk)
+        except Exception as e:
+            buffer.close(e)
+            raise
+        buffer.close()
+        return digest.hexdigest()
 
     async def run_forever(self):
         await self.start()
-        logger.info("TG client connected and running.")
-        await self.client.run_until_disconnected()
+        await self.pipeline.start()
+        watcher = asyncio.create_task(self._watch_connection()) if self.listening else None
+        logger.info(f"TG client connected and running (role: {settings.ROLE}).")
+        try:
+            while not self._stopping:
+                if self.listening:
+                    await self.catch_up()
+                await self.client.run_until_disconnected()
+                if self._stopping:
+                    break
+                logger.warning("Telegram disconnected, reconnecting in 5s")
+                await asyncio.sleep(5)
+                await self.client.connect()
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            await self.albums.flush_all()
+            await self._save_last_ids()
+            await self.pipeline.stop()
+
+    async def stop(self):
+        self._stopping = True
+        await self.client.disconnect()
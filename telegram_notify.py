@@ -1,18 +1,160 @@
-import aiohttp
-from config import settings
+import atexit
 import logging
+import queue
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from config import settings
+
+log = logging.getLogger("tg2yt.notify")
 
 
 class TelegramNotifier:
-    def __init__(self):
-        self.token = settings.TG_NOTIFY_BOT_TOKEN
-        self.chat_id = settings.TG_NOTIFY_CHAT_ID
+    """
+    Единый отправщик уведомлений в Telegram.
+    notify() только кладёт текст в очередь и никогда не блокирует вызывающего
+    (event loop или поток загрузки). Фоновый поток склеивает сообщения,
+    пришедшие за окно NOTIFY_BATCH_WINDOW, в один sendMessage, соблюдает
+    лимиты Bot API и retry_after, и ходит через одну долгоживущую сессию.
+    """
+
+    MAX_TEXT = 4096
+    MAX_SEND_ATTEMPTS = 3
+    # Bot API: не чаще ~1 сообщения в секунду и 20 сообщений в минуту на чат
+    MIN_INTERVAL = 1.0
+    PER_MINUTE = 20
+
+    def __init__(self, token: str = None, chat_id: str = None, window: float = None, queue_size: int = None):
+        self.token = settings.TG_NOTIFY_BOT_TOKEN if token is None else token
+        self.chat_id = settings.TG_NOTIFY_CHAT_ID if chat_id is None else chat_id
+        self.window = settings.NOTIFY_BATCH_WINDOW if window is None else window
+        self._queue: queue.Queue[str | None] = queue.Queue(
+            maxsize=settings.NOTIFY_QUEUE_SIZE if queue_size is None else queue_size
+        )
+        self._session: requests.Session | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._sent_at: list[float] = []
+        self._warned = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token and self.chat_id)
+
+    def notify(self, text: str):
+        """Ставит сообщение в очередь. Не блокирует; при переполнении сообщение теряется."""
+        if not self.enabled:
+            if not self._warned:
+                self._warned = True
+                log.warning("TG_NOTIFY_BOT_TOKEN or TG_NOTIFY_CHAT_ID not set")
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(text)
+        except queue.Full:
+            log.warning("Notification queue is full, message dropped")
 
     async def send_message(self, text: str):
-        if not self.token or not self.chat_id:
-            logging.warning("TG_NOTIFY_BOT_TOKEN or TG_NOTIFY_CHAT_ID not set")
+        """Совместимость с прежним API: сообщение уходит в фоновую очередь."""
+        self.notify(text)
+
+    def close(self, timeout: float = 5.0):
+        """Отправляет накопленное и останавливает фоновый поток."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
             return
+        self._thread.join(timeout)
 
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._session = requests.Session()
+                self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+                self._thread = threading.Thread(target=self._run, name="tg-notifier", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            text = self._queue.get()
+            if text is None:
+                break
+            batch = [text]
+            deadline = time.monotonic() + self.window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    text = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if text is None:
+                    stopping = True
+                    break
+                batch.append(text)
+
+            for message in self._pack(batch):
+                self._send(message)
+
+    def _pack(self, batch: list[str]) -> list[str]:
+        """Склеивает сообщения в минимальное число текстов не длиннее лимита Telegram."""
+        messages = []
+        current = ""
+        for text in batch:
+            text = text[:self.MAX_TEXT]
+            if current and len(current) + 2 + len(text) > self.MAX_TEXT:
+                messages.append(current)
+                current = text
+            else:
+                current = f"{current}\n\n{text}" if current else text
+        if current:
+            messages.append(current)
+        return messages
+
+    def _throttle(self):
+        now = time.monotonic()
+        self._sent_at = [t for t in self._sent_at if now - t < 60]
+        wait = 0.0
+        if self._sent_at:
+            wait = self._sent_at[-1] + self.MIN_INTERVAL - now
+        if len(self._sent_at) >= self.PER_MINUTE:
+            wait = max(wait, self._sent_at[0] + 60 - now)
+        if wait > 0:
+            time.sleep(wait)
+        self._sent_at.append(time.monotonic())
+
+    def _send(self, text: str):
         url = f"https://api.telegram.org/bot{self.token}/sendMessage"
-        async with aiohttp.ClientSession() as session:
-            await session.post(url, json={"chat_id": self.chat_id, "text": text})
+        for attempt in range(1, self.MAX_SEND_ATTEMPTS + 1):
+            self._throttle()
+            try:
+                resp = self._session.post(url, json={"chat_id": self.chat_id, "text": text}, timeout=10)
+            except requests.RequestException as e:
+                log.warning(f"Failed to send notification (attempt {attempt}): {e}")
+                time.sleep(2 ** attempt)
+                continue
+
+            if resp.status_code == 429:
+                try:
+                    retry_after = resp.json().get("parameters", {}).get("retry_after", 5)
+                except ValueError:
+                    retry_after = 5
+                time.sleep(retry_after)
+                continue
+            if resp.status_code >= 500:
+                time.sleep(2 ** attempt)
+                continue
+            if resp.status_code != 200:
+                log.warning(f"Notification rejected by Telegram: {resp.status_code} {resp.text[:200]}")
+            return
+
+
+notifier = TelegramNotifier()
+atexit.register(notifier.close)
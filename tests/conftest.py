@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Модули читают настройки и открывают лог при импорте — до него направляем лог во временный каталог
+os.environ.setdefault("LOG_PATH", os.path.join(tempfile.mkdtemp(prefix="tg2yt-test-"), "tg2yt.log"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
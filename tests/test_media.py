@@ -0,0 +1,37 @@
+import asyncio
+import os
+import pytest
+from media import MediaInfo, MediaStage, PASSTHROUGH, REMUX, TRANSCODE, PREPARED_SUFFIX, WEBM_SUFFIX
+
+
+@pytest.mark.parametrize("video, audio, action, suffix", [
+    ("vp9", "opus", REMUX, PREPARED_SUFFIX),
+    ("av1", "opus", REMUX, PREPARED_SUFFIX),
+    ("vp9", None, REMUX, PREPARED_SUFFIX),
+    ("vp8", "vorbis", PASSTHROUGH, WEBM_SUFFIX),
+    ("vp8", "opus", PASSTHROUGH, WEBM_SUFFIX),
+    ("vp9", "vorbis", PASSTHROUGH, WEBM_SUFFIX),
+    ("vp8", "aac", TRANSCODE, PREPARED_SUFFIX),
+])
+def test_webm_action(video, audio, action, suffix):
+    info = MediaInfo("matroska,webm", video, audio, False)
+    assert info.action == action
+    assert info.suffix == suffix
+
+
+def test_mp4_action():
+    assert MediaInfo("mov,mp4,m4a,3gp,3g2,mj2", "h264", "aac", True).action == PASSTHROUGH
+    assert MediaInfo("mov,mp4,m4a,3gp,3g2,mj2", "h264", "aac", True).suffix is None
+    assert MediaInfo("mov,mp4,m4a,3gp,3g2,mj2", "h264", "aac", False).action == REMUX
+
+
+def test_webm_passthrough_renamed(tmp_path, monkeypatch):
+    src = tmp_path / "tg_1_2.mp4"
+    src.write_bytes(b"webm")
+    stage = MediaStage(workers=1)
+    monkeypatch.setattr(stage, "_pool", lambda: None)
+    monkeypatch.setattr("media.probe", lambda path: MediaInfo("matroska,webm", "vp8", "vorbis", False))
+
+    path, action = asyncio.run(stage.prepare(str(src), "hash"))
+    assert (path, action) == (str(tmp_path / "tg_1_2.yt.webm"), PASSTHROUGH)
+    assert os.path.exists(path) and not src.exists()
@@ -0,0 +1,126 @@
+import socket
+import threading
+import time
+from collections import deque
+import httplib2
+from config import settings
+from metrics import UPLOAD_THROTTLE_SECONDS
+
+# Порция отправки: полоса выдаётся ждущим загрузкам по очереди такими кусками
+QUANTUM = 64 * 1024
+
+# TCP keep-alive: соединение простаивает между чанками и запросами, NAT и балансировщики его не должны забыть
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 15
+KEEPALIVE_COUNT = 4
+
+
+class BandwidthLimiter:
+    """
+    Общий token bucket на отправку в YouTube. Ждущие потоки обслуживаются строго
+    по очереди порциями не больше QUANTUM, поэтому одновременные загрузки делят
+    полосу поровну, а долю простаивающей (пауза между чанками, медленный сокет)
+    забирают остальные.
+    """
+
+    def __init__(self, rate: int, burst: int = 0):
+        self.rate = rate
+        self.burst = max(burst or rate, QUANTUM)
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+        self._cond = threading.Condition()
+        self._turns: deque[object] = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def consume(self, amount: int):
+        """Блокирует поток, пока в ведре не наберётся amount байт (и не подойдёт его очередь)."""
+        if not self.enabled:
+            return
+        amount = min(amount, self.burst)
+        started = time.monotonic()
+        turn = object()
+        with self._cond:
+            self._turns.append(turn)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                    self._stamp = now
+                    if self._turns[0] is not turn:
+                        self._cond.wait()
+                    elif self._tokens < amount:
+                        self._cond.wait((amount - self._tokens) / self.rate)
+                    else:
+                        self._tokens -= amount
+                        break
+            finally:
+                self._turns.remove(turn)
+                self._cond.notify_all()
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            UPLOAD_THROTTLE_SECONDS.inc(waited)
+
+
+bandwidth = BandwidthLimiter(settings.YT_UPLOAD_BANDWIDTH, settings.YT_UPLOAD_BURST)
+
+
+def _tune_socket(sock):
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for name, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE), ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+                        ("TCP_KEEPCNT", KEEPALIVE_COUNT)):
+        if hasattr(socket, name):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+
+class _PacedConnection:
+    """Отправка тела запроса порциями через общий лимитер полосы."""
+
+    def connect(self):
+        super().connect()
+        _tune_socket(self.sock)
+
+    def send(self, data):
+        if not bandwidth.enabled:
+            return super().send(data)
+        if hasattr(data, "read"):
+            while block := data.read(QUANTUM):
+                bandwidth.consume(len(block))
+                super().send(block)
+            return
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            return super().send(data)
+        view = memoryview(data)
+        for begin in range(0, len(view), QUANTUM):
+            piece = view[begin:begin + QUANTUM]
+            bandwidth.consume(len(piece))
+            super().send(piece)
+
+
+class PacedHTTPConnection(_PacedConnection, httplib2.HTTPConnectionWithTimeout):
+    pass
+
+
+class PacedHTTPSConnection(_PacedConnection, httplib2.HTTPSConnectionWithTimeout):
+    pass
+
+
+class YouTubeHttp(httplib2.Http):
+    """
+    Транспорт одного потока. httplib2.Http держит открытые соединения по хостам,
+    так что чанки и запросы API потока идут по уже установленному TCP/TLS-соединению.
+    Сам объект не потокобезопасен — делить его между потоками нельзя.
+    """
+
+    def __init__(self, timeout: float = None, **kwargs):
+        super().__init__(timeout=timeout or settings.YT_HTTP_TIMEOUT, **kwargs)
+        # Как в googleapiclient.http.build_http: 308 — ответ resumable-загрузки, а не редирект
+        self.redirect_codes = self.redirect_codes - {308}
+
+    def request(self, uri, *args, connection_type=None, **kwargs):
+        if connection_type is None:
+            connection_type = PacedHTTPSConnection if uri.startswith("https:") else PacedHTTPConnection
+        return super().request(uri, *args, connection_type=connection_type, **kwargs)
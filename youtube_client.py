@@ -1,17 +1,39 @@
 import os
 import json
+import datetime
 import time
-import logging
+import asyncio
+import tempfile
+import mimetypes
+import threading
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from googleapiclient.errors import ResumableUploadError
+from googleapiclient.http import MediaFileUpload, MediaInMemoryUpload, MediaUpload
+from googleapiclient.errors import ResumableUploadError, HttpError
 from concurrent.futures import ThreadPoolExecutor
 from config import settings
-from logger_setup import logger
-from notify_handler import TelegramLogHandler  # добавлено
+from db import (
+    get_upload_session, save_upload_session, delete_upload_session, find_upload_sessions, quota_used,
+    add_quota_usage,
+)
+from logger_setup import get_logger
+from telegram_notify import notifier
+from metrics import UPLOAD_BYTES, UPLOAD_CHUNK_SPEED, UPLOAD_RETRIES
+from transport import YouTubeHttp
+
+try:
+    from zoneinfo import ZoneInfo
+    PACIFIC = ZoneInfo("America/Los_Angeles")
+except Exception:  # нет базы часовых поясов в образе
+    PACIFIC = datetime.timezone(datetime.timedelta(hours=-8))
+
+logger = get_logger("youtube_client")
+
+# thumbnails.set стоит 50 единиц квоты
+THUMBNAIL_COST = 50
 
 SCOPES = [
     "https://www.googleapis.com/auth/youtube.upload",
@@ -19,81 +41,389 @@ SCOPES = [
 ]
 
 
+class StreamSourceError(Exception):
+    """Источник потоковой загрузки (скачивание из Telegram) завершился ошибкой."""
+
+
+class StreamSessionExpiredError(Exception):
+    """
+    Сессия потоковой загрузки истекла на стороне YouTube. Начать с нуля нельзя:
+    подтверждённые байты буфер уже отпустил — задачу нужно повторить со скачивания.
+    """
+
+
+class StreamBuffer:
+    """
+    Ограниченный буфер между iter_download (event loop) и загрузкой (поток).
+    Хранит байты начиная с последнего подтверждённого YouTube смещения.
+    Если чанк не прошёл, неподтверждённое окно выгружается во временный файл,
+    чтобы скачивание не стояло, пока загрузка ждёт повтора.
+    """
+
+    def __init__(self, capacity: int, loop: asyncio.AbstractEventLoop):
+        self.capacity = capacity
+        self._loop = loop
+        self._cond = threading.Condition()
+        self._space = asyncio.Event()
+        self._buf = bytearray()
+        self._base = 0  # смещение первого байта в self._buf
+        self._eof = False
+        self._error: BaseException | None = None
+        self._spill = None
+        self._spill_start = 0
+        self._spill_end = 0
+
+    # --- сторона Telegram (event loop) ---
+
+    async def write(self, data: bytes):
+        while True:
+            with self._cond:
+                if self._error is not None:
+                    raise StreamSourceError("stream consumer failed") from self._error
+                if not self._buf or len(self._buf) + len(data) <= self.capacity:
+                    self._buf += data
+                    self._cond.notify_all()
+                    return
+                self._space.clear()
+            await self._space.wait()
+
+    def close(self, error: BaseException | None = None):
+        with self._cond:
+            self._eof = True
+            if error is not None and self._error is None:
+                self._error = error
+            self._cond.notify_all()
+
+    # --- сторона загрузки (поток) ---
+
+    def getbytes(self, begin: int, length: int) -> bytes:
+        end = begin + length
+        with self._cond:
+            self._release(begin)
+            while not self._eof and self._base + len(self._buf) < end:
+                self._cond.wait()
+            if self._error is not None:
+                raise StreamSourceError(str(self._error)) from self._error
+            return self._read(begin, min(end, self._base + len(self._buf)))
+
+    def spill(self):
+        """Переносит неподтверждённое окно на диск и освобождает память."""
+        with self._cond:
+            if not self._buf:
+                return
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile(dir=settings.DOWNLOAD_DIR)
+                self._spill_start = self._base
+                self._spill_end = self._base
+            self._spill.seek(self._spill_end - self._spill_start)
+            self._spill.write(self._buf)
+            self._spill_end += len(self._buf)
+            self._base = self._spill_end
+            self._buf.clear()
+            self._notify_space()
+
+    def abort(self, error: BaseException):
+        """Загрузка прервана — будим и останавливаем сторону Telegram."""
+        with self._cond:
+            if self._error is None:
+                self._error = error
+            self._drop_spill()
+            self._notify_space()
+
+    def _release(self, begin: int):
+        # Всё до begin подтверждено YouTube — больше не понадобится
+        if self._spill is not None and begin >= self._spill_end:
+            self._drop_spill()
+        drop = min(begin - self._base, len(self._buf))
+        if drop > 0:
+            del self._buf[:drop]
+            self._base += drop
+            self._notify_space()
+
+    def _read(self, begin: int, end: int) -> bytes:
+        parts = []
+        if self._spill is not None and begin < self._spill_end:
+            self._spill.seek(begin - self._spill_start)
+            parts.append(self._spill.read(min(end, self._spill_end) - begin))
+            begin = self._spill_end
+        if begin < end:
+            parts.append(bytes(self._buf[begin - self._base:end - self._base]))
+        return b"".join(parts)
+
+    def _drop_spill(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    def _notify_space(self):
+        self._loop.call_soon_threadsafe(self._space.set)
+
+
+class TelegramStreamUpload(MediaUpload):
+    """Resumable MediaUpload, читающий байты из StreamBuffer вместо файла."""
+
+    def __init__(self, buffer: StreamBuffer, name: str, size: int | None,
+                 mimetype: str = "video/mp4", chunksize: int = 8 * 1024 * 1024):
+        self.buffer = buffer
+        self.name = name
+        self._size = size
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return self._size
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def getbytes(self, begin, length):
+        return self.buffer.getbytes(begin, length)
+
+    def spill(self):
+        self.buffer.spill()
+
+    def to_json(self):
+        raise NotImplementedError("Streaming upload cannot be serialized")
+
+
+class AdaptiveChunkSize:
+    """
+    Размер чанка resumable-загрузки по измеренной скорости:
+    стремимся к ~YT_CHUNK_TARGET_SECONDS на чанк, не более чем вдвое за шаг.
+    YouTube требует, чтобы чанк был кратен 256 KiB.
+    """
+
+    UNIT = 256 * 1024
+
+    def __init__(self, initial: int, minimum: int = None, maximum: int = None, target_seconds: float = None):
+        self.minimum = max(self.UNIT, minimum or settings.YT_CHUNK_MIN)
+        self.maximum = max(self.minimum, min(maximum or settings.YT_CHUNK_MAX, settings.YT_CHUNK_MAX))
+        self.target_seconds = target_seconds or settings.YT_CHUNK_TARGET_SECONDS
+        self.size = self.clamp(initial)
+
+    def clamp(self, size: int) -> int:
+        size = int(size) // self.UNIT * self.UNIT
+        return max(self.minimum // self.UNIT * self.UNIT, min(self.maximum // self.UNIT * self.UNIT, size))
+
+    def update(self, sent: int, elapsed: float) -> int:
+        if sent > 0 and elapsed > 0:
+            wanted = sent / elapsed * self.target_seconds
+            self.size = self.clamp(max(self.size / 2, min(self.size * 2, wanted)))
+        return self.size
+
+    def shrink(self) -> int:
+        self.size = self.clamp(self.size // 2)
+        return self.size
+
+
+class QuotaExceededError(Exception):
+    """У аккаунта YouTube закончилась дневная квота на загрузки."""
+
+
+def _is_quota_error(error: HttpError) -> bool:
+    return error.resp.status == 403 and any(
+        reason in (error.content or b"") for reason in (b"quotaExceeded", b"uploadLimitExceeded")
+    )
+
+
 class YouTubeUploader:
     SUPPORTED_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm")
 
-    def __init__(self, client_secrets_file=None, token_file=None):
+    # Обновляем токен заранее, чтобы загрузки не ловили истечение посреди чанка
+    REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+    def __init__(self, client_secrets_file=None, token_file=None, name: str = "default",
+                 executor: ThreadPoolExecutor = None, auth_executor: ThreadPoolExecutor = None):
+        self.name = name
         self.client_secrets_file = client_secrets_file or settings.YOUTUBE_CLIENT_SECRETS
         self.token_file = token_file or settings.YOUTUBE_TOKEN
         os.makedirs(os.path.dirname(self.token_file), exist_ok=True)
         self.creds = None
-        self.service = None
-        self._init_creds()
-        self.executor = ThreadPoolExecutor(max_workers=2)
+        self._service = None
+        # Учётные данные и клиент API создаются лениво, один раз
+        self._creds_lock = threading.Lock()
+        self.executor = executor or ThreadPoolExecutor(max_workers=settings.YT_UPLOAD_THREADS)
+        # Обновление токена и OAuth — в своём потоке: не ждут за чанками и не занимают слот загрузки
+        self.auth_executor = auth_executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="yt-auth")
+        # Транспорт (httplib2.Http) у каждого потока пула свой: общий не потокобезопасен
+        self.http_factory = YouTubeHttp
+        self._local = threading.local()
 
-        # Telegram уведомления
-        self.tg_handler = TelegramLogHandler(
-            token=settings.TG_NOTIFY_BOT_TOKEN,
-            chat_id=settings.TG_NOTIFY_CHAT_ID,
-        )
+    @property
+    def service(self):
+        if self._service is None:
+            with self._creds_lock:
+                if self._service is None:
+                    try:
+                        self._init_creds()
+                    except Exception as e:
+                        if self.creds is None:
+                            raise
+                        # Токен есть, не удалось только обновить: истёкший обновит AuthorizedHttp при 401
+                        logger.warning(f"Failed to refresh credentials for {self.name}: {e}")
+                    # Discovery-документ берём из копии, поставляемой с библиотекой, — без сетевого запроса
+                    self._service = build(
+                        "youtube", "v3", credentials=self.creds, static_discovery=True, cache_discovery=False
+                    )
+        return self._service
+
+    async def get_service(self):
+        """Клиент API; первое создание (токен, возможно OAuth) идёт в потоке, а не в event loop."""
+        if self._service is not None:
+            return self._service
+        return await asyncio.get_running_loop().run_in_executor(self.auth_executor, lambda: self.service)
+
+    def _http(self) -> AuthorizedHttp:
+        """Авторизованный транспорт текущего потока; соединения в нём живут между запросами."""
+        http = getattr(self._local, "http", None)
+        if http is None or http.credentials is not self.creds:
+            http = self._local.http = AuthorizedHttp(self.creds, http=self.http_factory())
+        return http
+
+    def _execute(self, request):
+        return request.execute(http=self._http())
+
+    def _next_chunk(self, request):
+        return request.next_chunk(http=self._http())
 
     def _init_creds(self):
-        if os.path.exists(self.token_file):
+        if self.creds is None and os.path.exists(self.token_file):
             try:
                 self.creds = Credentials.from_authorized_user_file(self.token_file, SCOPES)
             except Exception:
                 logger.exception("Failed to load credentials from token file")
                 self.creds = None
 
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                try:
-                    self.creds.refresh(Request())
-                except Exception:
-                    logger.exception("Failed to refresh credentials")
-                    self.creds = None
-            else:
-                logger.info("Starting OAuth flow for YouTube credentials (follow instructions).")
-                flow = InstalledAppFlow.from_client_secrets_file(self.client_secrets_file, SCOPES)
-                self.creds = flow.run_local_server(port=0)
+        if self.creds and self.creds.valid and not self._expires_soon():
+            return
+        if self.creds and self.creds.refresh_token:
+            # Ошибка обновления (сеть, 5xx) уходит вызывающему, а прежний токен остаётся:
+            # интерактивный вход в контейнере без браузера повис бы навсегда
+            self.creds.refresh(Request())
+        else:
+            # Пригодного токена нет совсем — только тогда нужен вход через браузер
+            logger.info("Starting OAuth flow for YouTube credentials (follow instructions).")
+            flow = InstalledAppFlow.from_client_secrets_file(self.client_secrets_file, SCOPES)
+            self.creds = flow.run_local_server(port=0)
+
+        with open(self.token_file, "w", encoding="utf-8") as f:
+            f.write(self.creds.to_json())
 
-            with open(self.token_file, "w", encoding="utf-8") as f:
-                f.write(self.creds.to_json())
+    def _expires_soon(self) -> bool:
+        expiry = getattr(self.creds, "expiry", None)
+        return expiry is not None and expiry - datetime.datetime.utcnow() < self.REFRESH_MARGIN
 
-        self.service = build("youtube", "v3", credentials=self.creds)
+    def _refresh_ahead(self) -> float:
+        """Обновляет токен, если он скоро истечёт. Возвращает, через сколько секунд проверить снова."""
+        with self._creds_lock:
+            self._init_creds()
+            expiry = getattr(self.creds, "expiry", None)
+        if expiry is None:
+            return 3600
+        left = (expiry - datetime.datetime.utcnow() - self.REFRESH_MARGIN).total_seconds()
+        return max(30.0, left)
 
-    def _build_request_body(self, title: str, description: str, privacy: str):
+    async def keep_fresh(self):
+        """Фоновое обновление токена до истечения срока; после сбоя — повтор с растущей паузой."""
+        loop = asyncio.get_running_loop()
+        failures = 0
+        while True:
+            try:
+                delay = await loop.run_in_executor(self.auth_executor, self._refresh_ahead)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                delay = min(30 * 2 ** (failures - 1), 900)
+                logger.warning(f"Background credentials refresh failed for {self.name} ({e}), retry in {delay}s")
+            await asyncio.sleep(delay)
+
+    def _build_request_body(self, title: str, description: str, privacy: str, tags: list[str] = None):
+        snippet = {"title": title, "description": description}
+        if tags:
+            snippet["tags"] = tags
         return {
-            "snippet": {"title": title, "description": description},
+            "snippet": snippet,
             "status": {"privacyStatus": privacy}
         }
 
+    async def create_playlist(self, title: str, privacy: str = None) -> str:
+        service = await self.get_service()
+        body = {
+            "snippet": {"title": title[:150]},
+            "status": {"privacyStatus": privacy or settings.YOUTUBE_UPLOAD_PRIVACY},
+        }
+        request = service.playlists().insert(part="snippet,status", body=body)
+        response = await asyncio.get_running_loop().run_in_executor(self.executor, self._execute, request)
+        return response["id"]
+
+    async def add_to_playlist(self, playlist_id: str, video_id: str):
+        service = await self.get_service()
+        body = {
+            "snippet": {
+                "playlistId": playlist_id,
+                "resourceId": {"kind": "youtube#video", "videoId": video_id},
+            }
+        }
+        request = service.playlistItems().insert(part="snippet", body=body)
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._execute, request)
+
+    async def set_thumbnail(self, video_id: str, data: bytes, mimetype: str = "image/jpeg"):
+        service = await self.get_service()
+        request = service.thumbnails().set(videoId=video_id, media_body=MediaInMemoryUpload(data, mimetype=mimetype))
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._execute, request)
+        await add_quota_usage(self.name, quota_day(), THUMBNAIL_COST)
+
     def _notify(self, message: str):
-        """Отправка уведомления в Telegram через handler."""
-        record = logging.LogRecord(
-            name="YouTubeUploader",
-            level=logging.INFO,
-            pathname=__file__,
-            lineno=0,
-            msg=message,
-            args=None,
-            exc_info=None
-        )
-        self.tg_handler.emit(record)
-
-    def upload(self, file_path: str, title: str, description: str, privacy: str = None, chunk_size: int = 256 * 1024):
-        """Blocking upload call (runs in thread). Returns uploaded video id on success."""
+        """Отправка уведомления в Telegram (через фоновую очередь, не блокирует поток)."""
+        notifier.notify(message)
+
+    async def upload_async(self, file_path: str, title: str, description: str, privacy: str = None,
+                           chunk_size: int = None, session_key: str = None, tags: list[str] = None):
+        """
+        Загружает файл. Если передан session_key, resumable-сессия и подтверждённое
+        смещение сохраняются в БД, и повторный вызов (в т.ч. после перезапуска)
+        продолжает загрузку с последнего принятого байта.
+        """
         if not file_path.lower().endswith(self.SUPPORTED_EXTENSIONS):
             logger.warning(f"⛔ Unsupported media type, skipping: {file_path}")
             return None
 
+        chunker = AdaptiveChunkSize(chunk_size or settings.YT_CHUNK_INITIAL)
+        # Тип по расширению: .yt.webm уходит как video/webm, а не как application/octet-stream
+        mimetype = mimetypes.guess_type(file_path)[0] or "video/mp4"
+        media = MediaFileUpload(file_path, mimetype=mimetype, chunksize=chunker.size, resumable=True)
+        return await self._upload_media(media, chunker, file_path, title, description, privacy, session_key, tags)
+
+    async def upload_stream_async(self, media: "TelegramStreamUpload", title: str, description: str,
+                                  privacy: str = None, tags: list[str] = None):
+        """Потоковая загрузка: байты берутся из буфера по мере скачивания."""
+        # Чанк не может быть больше половины буфера, иначе скачивание и загрузка ждут друг друга
+        chunker = AdaptiveChunkSize(media.chunksize(), maximum=media.buffer.capacity // 2)
+        return await self._upload_media(media, chunker, media.name, title, description, privacy, None, tags)
+
+    async def _upload_media(self, media: MediaUpload, chunker: "AdaptiveChunkSize", file_path: str,
+                            title: str, description: str, privacy: str = None, session_key: str = None,
+                            tags: list[str] = None):
         if privacy is None:
             privacy = settings.YOUTUBE_UPLOAD_PRIVACY
 
+        loop = asyncio.get_running_loop()
         title = (title or "")[:settings.MAX_TITLE_LENGTH]
-        body = self._build_request_body(title, description or "", privacy)
-        media = MediaFileUpload(file_path, chunksize=chunk_size, resumable=True)
-        request = self.service.videos().insert(part="snippet,status", body=body, media_body=media)
+        body = self._build_request_body(title, description or "", privacy, tags)
+        service = await self.get_service()
+        request = service.videos().insert(part="snippet,status", body=body, media_body=media)
+        if session_key:
+            await self._restore_session(request, chunker, session_key)
+        media._chunksize = chunker.size
         retry = 0
         max_retries = 5
 
@@ -102,37 +432,191 @@ class YouTubeUploader:
         # self._notify(msg)
 
         while True:
+            started = time.monotonic()
+            progress = request.resumable_progress
+            # Без resumable_uri next_chunk откроет новую сессию videos.insert — только она стоит квоты
+            opening = request.resumable_uri is None
             try:
-                status, response = request.next_chunk()
+                # Сам HTTP-запрос блокирующий — в поток; ожидание между попытками — в event loop
+                try:
+                    status, response = await loop.run_in_executor(self.executor, self._next_chunk, request)
+                finally:
+                    if opening and request.resumable_uri:
+                        await add_quota_usage(self.name, quota_day(), settings.YOUTUBE_UPLOAD_COST)
+                elapsed = time.monotonic() - started
+                sent = ((media.size() or progress) if response else request.resumable_progress) - progress
+                if sent > 0:
+                    UPLOAD_BYTES.inc(sent, account=self.name)
+                    UPLOAD_CHUNK_SPEED.observe(sent / max(elapsed, 1e-6), account=self.name)
                 if response:
                     video_id = response.get("id")
+                    if session_key:
+                        await delete_upload_session(session_key)
                     # msg = f"✅ Видео успешно загружено: {title}\nYouTube ID: {video_id}"
                     # logger.info(msg)
                     # self._notify(msg)
                     return video_id
+
+                media._chunksize = chunker.update(request.resumable_progress - progress, elapsed)
+                retry = 0
+                if session_key:
+                    await save_upload_session(session_key, request.resumable_uri, request.resumable_progress, chunker.size)
             except ResumableUploadError as e:
                 if "Media type" in str(e):
                     msg = f"⚠️ Пропущен неподдерживаемый файл: {file_path}"
                     logger.warning(msg)
                     self._notify(msg)
                     return None
+                if _is_quota_error(e):
+                    raise QuotaExceededError(self.name) from e
                 raise
-            except Exception as e:
-                retry += 1
-                msg = f"❌ Ошибка при загрузке видео '{title}': {e}"
-                logger.exception(msg)
-                self._notify(msg)
-
-                if retry > max_retries:
-                    final_msg = f"🚨 Превышено число попыток загрузки видео '{title}' — прекращено."
-                    logger.error(final_msg)
-                    self._notify(final_msg)
+            except StreamSourceError:
+                # Источник (скачивание из Telegram) упал — повторять загрузку бессмысленно
+                raise
+            except HttpError as e:
+                if e.resp.status in (404, 410) and request.resumable_uri:
+                    if isinstance(media, TelegramStreamUpload):
+                        raise StreamSessionExpiredError(f"resumable session expired for '{title}'") from e
+                    # Сессия истекла на стороне YouTube — файл начинаем заново
+                    logger.warning(f"Resumable session expired for '{title}', restarting from zero")
+                    await self._reset_session(request, session_key)
+                    continue
+                if _is_quota_error(e):
+                    raise QuotaExceededError(self.name) from e
+                if e.resp.status < 500 and e.resp.status not in (408, 429):
                     raise
-                sleep_time = 2 ** retry
-                logger.info(f"Повторная попытка через {sleep_time}s (попытка {retry}/{max_retries})")
-                time.sleep(sleep_time)
-
-    async def upload_async(self, file_path: str, title: str, description: str, privacy: str = None):
-        import asyncio
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(self.executor, self.upload, file_path, title, description, privacy)
+                retry = await self._retry_wait(e, media, chunker, title, retry, max_retries)
+            except Exception as e:
+                retry = await self._retry_wait(e, media, chunker, title, retry, max_retries)
+
+    async def _retry_wait(self, error: Exception, media: MediaUpload, chunker: "AdaptiveChunkSize",
+                          title: str, retry: int, max_retries: int) -> int:
+        retry += 1
+        UPLOAD_RETRIES.inc(account=self.name)
+        msg = f"❌ Ошибка при загрузке видео '{title}': {error}"
+        # При сетевом сбое так падают все загрузки разом — в логе хватит нескольких записей в минуту.
+        # В Telegram запись уходит через TelegramLogHandler, после того же ограничения
+        logger.exception(msg, extra={"throttle": "chunk-retry"})
+
+        if retry > max_retries:
+            # Сессия остаётся в БД — следующая попытка задачи продолжит с того же места
+            final_msg = f"🚨 Превышено число попыток загрузки видео '{title}' — прекращено."
+            logger.error(final_msg)
+            raise error
+        if isinstance(media, TelegramStreamUpload):
+            # Чанк не подтверждён: выгружаем его на диск, чтобы не держать скачивание
+            media.spill()
+        media._chunksize = chunker.shrink()
+        sleep_time = 2 ** retry
+        logger.info(f"Повторная попытка через {sleep_time}s (попытка {retry}/{max_retries})",
+                    extra={"throttle": "chunk-retry-wait"})
+        await asyncio.sleep(sleep_time)
+        return retry
+
+    async def _restore_session(self, request, chunker: "AdaptiveChunkSize", session_key: str):
+        session = await get_upload_session(session_key)
+        if session is None:
+            return
+        logger.info(f"Resuming upload {session_key} from byte {session.offset}")
+        request.resumable_uri = session.resumable_uri
+        request.resumable_progress = session.offset
+        # Первый next_chunk спросит у YouTube реально принятый диапазон
+        request._in_error_state = True
+        chunker.size = chunker.clamp(session.chunk_size)
+
+    async def _reset_session(self, request, session_key: str | None):
+        request.resumable_uri = None
+        request.resumable_progress = 0
+        request._in_error_state = False
+        if session_key:
+            await delete_upload_session(session_key)
+
+
+def quota_day() -> str:
+    """Квота YouTube сбрасывается в полночь по тихоокеанскому времени."""
+    return datetime.datetime.now(PACIFIC).date().isoformat()
+
+
+def seconds_until_quota_reset() -> float:
+    now = datetime.datetime.now(PACIFIC)
+    tomorrow = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - now).total_seconds()
+
+
+class YouTubeUploaderPool:
+    """
+    Несколько аккаунтов YouTube с учётом дневной квоты каждого (в БД).
+    Загрузка уходит на аккаунт, закреплённый за каналом, либо на аккаунт
+    с наибольшим остатком квоты. Если квоты нет ни у кого — acquire() ждёт.
+    """
+
+    def __init__(self, accounts: list[tuple[str, str, str]] = None, channel_accounts: dict[str, str] = None):
+        accounts = accounts or settings.YOUTUBE_ACCOUNTS or [
+            ("default", settings.YOUTUBE_CLIENT_SECRETS, settings.YOUTUBE_TOKEN)
+        ]
+        # Один пул потоков на все аккаунты: его размер и есть предел параллельных загрузок
+        self.executor = ThreadPoolExecutor(max_workers=settings.YT_UPLOAD_THREADS, thread_name_prefix="yt-upload")
+        self.auth_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="yt-auth")
+        self.uploaders = {
+            name: YouTubeUploader(secrets, token, name=name, executor=self.executor, auth_executor=self.auth_executor)
+            for name, secrets, token in accounts
+        }
+        self.channel_accounts = settings.YOUTUBE_CHANNEL_ACCOUNTS if channel_accounts is None else channel_accounts
+        self._lock = asyncio.Lock()
+        self._refreshers: list[asyncio.Task] = []
+
+    def start(self):
+        """Запускает фоновое обновление токенов (первое — сразу, не задерживая старт)."""
+        if not self._refreshers:
+            self._refreshers = [asyncio.create_task(u.keep_fresh()) for u in self.uploaders.values()]
+
+    async def stop(self):
+        for task in self._refreshers:
+            task.cancel()
+        await asyncio.gather(*self._refreshers, return_exceptions=True)
+        self._refreshers = []
+
+    async def remaining(self, name: str) -> int:
+        return settings.YOUTUBE_DAILY_QUOTA - await quota_used(name, quota_day())
+
+    async def acquire(self, *channel_keys, session_prefix: str = None) -> YouTubeUploader:
+        """
+        Выбирает аккаунт с остатком квоты на videos.insert. Списывается она, когда
+        загрузка открывает новую сессию: продолжение сохранённой сессии бесплатно.
+        Если у задачи есть сессия (ключи session_prefix + имя аккаунта), берётся её аккаунт,
+        пока он не исчерпан. Пока квота исчерпана, ждёт (задача остаётся в конвейере, а не падает).
+        """
+        while True:
+            async with self._lock:
+                uploader = await self._resume_account(session_prefix) or await self._pick(channel_keys)
+                if uploader is not None:
+                    return uploader
+            wait = min(seconds_until_quota_reset() + 60, settings.YOUTUBE_QUOTA_RECHECK)
+            logger.warning(f"YouTube quota exhausted for {channel_keys or 'all accounts'}, waiting {wait:.0f}s")
+            await asyncio.sleep(wait)
+
+    async def _resume_account(self, session_prefix: str | None) -> YouTubeUploader | None:
+        """Аккаунт с открытой сессией задачи: на другом загрузка начнётся с нуля и снова стоит квоты."""
+        if not session_prefix:
+            return None
+        for session in await find_upload_sessions(session_prefix):
+            name = session.session_key[len(session_prefix):]
+            if name in self.uploaders and await self.remaining(name) > 0:
+                return self.uploaders[name]
+        return None
+
+    async def _pick(self, channel_keys) -> YouTubeUploader | None:
+        cost = settings.YOUTUBE_UPLOAD_COST
+        for key in channel_keys:
+            name = self.channel_accounts.get(str(key))
+            if name in self.uploaders:
+                return self.uploaders[name] if await self.remaining(name) >= cost else None
+
+        remaining = {name: await self.remaining(name) for name in self.uploaders}
+        best = max(remaining, key=remaining.get)
+        return self.uploaders[best] if remaining[best] >= cost else None
+
+    async def mark_exhausted(self, uploader: YouTubeUploader):
+        """YouTube ответил quotaExceeded — до сброса этот аккаунт не используем."""
+        day = quota_day()
+        await add_quota_usage(uploader.name, day, max(0, await self.remaining(uploader.name)))